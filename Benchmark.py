@@ -0,0 +1,322 @@
+"""Reproducible scaling benchmarks for allocation, routing and table refresh.
+
+    python Benchmark.py -o baseline.json              # full grid, up to 1M packages
+    python Benchmark.py --quick --compare baseline.json
+
+Workloads are synthetic and seeded, so two runs with the same --seed see
+the same packages and cities. Every case reports wall time, peak traced
+memory (tracemalloc, in a separate run so it does not skew the timing) and
+solution quality: trucks used against the weight lower bound, tour length.
+Table refreshes run through TableView on a Tk-free stand-in Treeview, so
+no display is needed.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+from itertools import chain
+
+from TruckCore import (
+    ALLOCATION_STRATEGIES, CityRegistry, DistanceMatrix, PackageStore, PointDistances, TruckManager,
+    generate_distance_matrix_from_coordinates, knapsack_select, solve_tsp,
+    tour_length, tsp_greedy_with_distances, np,
+)
+
+try:
+    from LoadingAndRouting import TableView, package_row
+except ImportError:  # Python built without Tk; table cases are skipped
+    TableView = None
+
+BENCH_SEED = 1234
+FULL_GRID = {
+    "packages": (10, 1_000, 100_000, 1_000_000),
+    "capacities": (25, 1_000, 50_000),
+    "cities": (10, 100, 1_000, 3_000),
+    # The knapsack strategy fills one truck per pass, O(trucks x packages)
+    "knapsack_strategy_limit": 10_000,
+}
+QUICK_GRID = {
+    "packages": (10, 1_000, 10_000),
+    "capacities": (25, 1_000),
+    "cities": (10, 100, 300),
+    "knapsack_strategy_limit": 1_000,
+}
+# Timing repeats for fast cases; the best run is reported
+BENCH_REPEAT = 5
+REPEAT_BUDGET = 1.0
+# The local-search pass is skipped for larger workloads
+IMPROVE_LIMIT = 100_000
+SHIPPING = ("COD", "Bank Transfer", "Credit Card")
+STATUSES = ("Unpaid", "Paid", "Pay later (COD)")
+
+
+# Synthetic Workloads
+def max_item_weight(capacity):
+    # Weights 1-10 at the default capacity of 25; heavier items for bigger trucks
+    return max(10, capacity * 2 // 5)
+
+
+def synthetic_cities(count, seed=BENCH_SEED):
+    """Hanoi plus `count - 1` random points inside Vietnam's bounding box."""
+    rng = random.Random(seed)
+    coordinates = {"Hanoi": (21.0285, 105.8542)}
+    for i in range(1, count):
+        coordinates[f"C{i:05d}"] = (rng.uniform(8.5, 23.4), rng.uniform(102.1, 109.5))
+    return coordinates
+
+
+def synthetic_store(count, capacity, cities=100, seed=BENCH_SEED):
+    rng = random.Random(seed)
+    heaviest = max_item_weight(capacity)
+    columns = {
+        "weights": array("l", (rng.randint(1, heaviest) for _ in range(count))),
+        "distances": array("l", (rng.randint(100, 2000) for _ in range(count))),
+        "location_ids": array("L", (rng.randrange(cities) for _ in range(count))),
+        "shipping_ids": array("B", (rng.randrange(len(SHIPPING)) for _ in range(count))),
+        "status_ids": array("B", (rng.randrange(len(STATUSES)) for _ in range(count))),
+    }
+    codes = [f"B{i:07d}" for i in range(count)]
+    return PackageStore.from_columns(codes, columns, list(synthetic_cities(cities, seed)),
+                                     SHIPPING, STATUSES)
+
+
+class HeadlessTree:
+    """The part of ttk.Treeview that TableView uses, without Tk."""
+
+    def __init__(self):
+        self.values = {}
+        self.order = []
+
+    def insert(self, parent, index, iid, values):
+        self.order.insert(index, iid)
+        self.values[iid] = values
+
+    def delete(self, iid):
+        self.order.remove(iid)
+        del self.values[iid]
+
+    def move(self, iid, parent, index):
+        self.order.remove(iid)
+        self.order.insert(index, iid)
+
+    def item(self, iid, values=None):
+        if values is not None:
+            self.values[iid] = values
+        return {"values": self.values[iid]}
+
+    def get_children(self):
+        return tuple(self.order)
+
+
+# Cases: (name, params, setup, run, quality); only run() is measured
+def allocation_quality(weights, capacity, trucks):
+    total = sum(weights)
+    return {
+        "trucks": len(trucks),
+        "lower_bound": math.ceil(total / capacity),
+        "utilization": round(total / (len(trucks) * capacity), 4) if trucks else 0.0,
+    }
+
+
+def allocation_cases(grid, seed):
+    for count in grid["packages"]:
+        for capacity in grid["capacities"]:
+            store = synthetic_store(count, capacity, seed=seed)
+            params = {"packages": count, "capacity": capacity}
+
+            weights = store.weights
+            yield ("knapsack", params, None,
+                   lambda weights=weights, capacity=capacity: knapsack_select(weights, capacity),
+                   lambda chosen, weights=weights: {"load": sum(weights[i] for i in chosen)})
+
+            # The store's own cities, so the cluster strategy sweeps real bearings
+            cities = CityRegistry("Hanoi", ((c, lat, lon) for c, (lat, lon) in synthetic_cities(100, seed).items()))
+            manager = TruckManager(max_weight=capacity, packages=store, truck_rows=[], cities=cities)
+            for strategy in ALLOCATION_STRATEGIES:
+                if strategy == "knapsack" and count > grid["knapsack_strategy_limit"]:
+                    continue
+                for improve in (False, True):
+                    if improve and (strategy in ("knapsack", "cluster") or count > IMPROVE_LIMIT):
+                        continue
+                    yield ("allocate_trucks", {**params, "strategy": strategy, "improve": improve}, None,
+                           lambda manager=manager, strategy=strategy, improve=improve:
+                               manager.allocate_trucks(strategy=strategy, improve=improve),
+                           lambda trucks, weights=weights, capacity=capacity:
+                               allocation_quality(weights, capacity, trucks))
+
+
+def routing_cases(grid, seed):
+    for count in grid["cities"]:
+        coordinates = synthetic_cities(count, seed)
+        cities = list(coordinates)
+        params = {"cities": count}
+
+        yield ("distance_matrix", params, None,
+               lambda cities=cities, coordinates=coordinates:
+                   generate_distance_matrix_from_coordinates(cities, coordinates, "haversine"),
+               lambda rows: {"entries": len(rows) ** 2})
+
+        matrix = DistanceMatrix.build(cities, coordinates, "haversine").rows(cities)
+        from_hanoi = dict(zip(cities, matrix[0]))
+        index = {city: i for i, city in enumerate(cities)}
+        yield ("tsp_greedy_with_distances", params, None,
+               lambda from_hanoi=from_hanoi, cities=cities: tsp_greedy_with_distances(from_hanoi, cities),
+               lambda route, matrix=matrix, index=index:
+                   {"tour_km": round(tour_length([index[c] for c in route], matrix), 1)})
+        yield ("solve_tsp", params, None,
+               lambda matrix=matrix: solve_tsp(matrix),
+               lambda result: {"tour_km": round(result[1], 1)})
+        # What DistanceService.rows hands the solver past DENSE_ROUTE_LIMIT cities
+        points = [coordinates[c] for c in cities]
+        yield ("solve_tsp_spatial", params, None,
+               lambda points=points: solve_tsp(PointDistances(points)),
+               lambda result: {"tour_km": round(result[1], 1)})
+
+
+def table_cases(grid, seed):
+    if TableView is None:
+        return
+    for count in grid["packages"]:
+        store = synthetic_store(count, 25, seed=seed)
+        params = {"rows": count}
+
+        def rows(store=store):
+            return ((p.package_code, package_row(p)) for p in store)
+
+        def sync(view, store=store, rows=rows):
+            view.sync(rows(), len(store))
+            return view
+
+        def synced(sync=sync):
+            return sync(TableView(HeadlessTree()))
+
+        def sync_one_changed(view, store=store, rows=rows):
+            changed = rows()
+            code, values = next(changed)
+            view.sync(chain([(code, values[:-1] + ("Paid",))], changed), len(store))
+            return view
+
+        def quality(view):
+            return {"rendered": len(view.rendered)}
+
+        yield "table_sync_initial", params, lambda: TableView(HeadlessTree()), sync, quality
+        yield "table_sync_unchanged", params, synced, sync, quality
+        yield "table_sync_one_changed", params, synced, sync_one_changed, quality
+
+
+# Runner
+def measure(setup, run, memory=True, repeat=BENCH_REPEAT):
+    """(best seconds, peak traced KiB or None, result) of run().
+
+    Fast cases are repeated up to `repeat` times and the best time kept;
+    anything slower than REPEAT_BUDGET seconds in total runs once.
+    """
+    seconds = float("inf")
+    spent = 0.0
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        result = run(state) if setup else run()
+        elapsed = time.perf_counter() - start
+        seconds = min(seconds, elapsed)
+        spent += elapsed
+        if spent > REPEAT_BUDGET:
+            break
+
+    peak_kib = None
+    if memory:
+        state = setup() if setup else None
+        tracemalloc.start()
+        try:
+            run(state) if setup else run()
+            peak_kib = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_kib, result
+
+
+def run_benchmarks(grid, seed=BENCH_SEED, memory=True, only=None, repeat=BENCH_REPEAT, progress=None):
+    results = []
+    for cases in (allocation_cases(grid, seed), routing_cases(grid, seed), table_cases(grid, seed)):
+        for name, params, setup, run, quality in cases:
+            if only and name not in only:
+                continue
+            seconds, peak_kib, result = measure(setup, run, memory, repeat)
+            entry = {"bench": name, "params": params, "seconds": round(seconds, 6),
+                     "peak_kib": peak_kib, "quality": quality(result)}
+            results.append(entry)
+            if progress is not None:
+                progress(entry)
+    return results
+
+
+def case_key(entry):
+    return entry["bench"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(results, baseline):
+    """One line per case also in `baseline`: time ratio and any quality change."""
+    previous = {case_key(entry): entry for entry in baseline["results"]}
+    lines = []
+    for entry in results:
+        old = previous.get(case_key(entry))
+        if old is None:
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        line = f"{entry['bench']} {entry['params']}: {ratio:.2f}x time"
+        if entry["quality"] != old["quality"]:
+            line += f", quality {old['quality']} -> {entry['quality']}"
+        lines.append(line)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time, memory and quality of the truck engines at scale.")
+    parser.add_argument("-o", "--output", help="write the results as a JSON baseline here")
+    parser.add_argument("--quick", action="store_true", help="small grid (seconds instead of minutes)")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="timing runs per fast case")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--only", nargs="+", help="bench names to run, e.g. solve_tsp table_sync_initial")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+
+    def progress(entry):
+        memory = "" if entry["peak_kib"] is None else f", {entry['peak_kib']} KiB"
+        print(f"{entry['bench']} {entry['params']}: {entry['seconds']:.4f}s{memory} {entry['quality']}",
+              file=sys.stderr)
+
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    results = run_benchmarks(grid, args.seed, memory=not args.no_memory, only=args.only,
+                             repeat=args.repeat, progress=progress)
+    report = {
+        "meta": {
+            "seed": args.seed,
+            "grid": grid,
+            "python": platform.python_version(),
+            "numpy": None if np is None else np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Write fleet invoices to CSV or plain-text files.
+
+Invoices come from TruckManager.invoice_fleet, which prices every package
+in one vectorized pass over the columns and copies each truck's lines into
+its Invoice. The writers emit one line at a time rather than building the
+file's text in memory.
+"""
+import csv
+import json
+
+from TruckCore import Tariff
+
+INVOICE_CSV_FIELDS = ("truck", "package_code", "location", "cost")
+
+
+def load_tariff(path):
+    """Tariff from a JSON table:
+
+        {"rate": 0.05, "base": 100, "shipping_types": {"COD": {"rate": 0.06, "base": 120}}}
+    """
+    with open(path) as f:
+        return Tariff.from_dict(json.load(f))
+
+
+def fleet_summary(invoices):
+    invoiced = [invoice for invoice in invoices if not invoice.unpaid]
+    return {
+        "invoiced_trucks": len(invoiced),
+        "blocked_trucks": len(invoices) - len(invoiced),
+        "packages": sum(len(invoice) for invoice in invoiced),
+        "total": sum(invoice.total for invoice in invoiced),
+    }
+
+
+def write_invoices_csv(invoices, path):
+    """One row per invoiced package; trucks blocked by unpaid packages are left out."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(INVOICE_CSV_FIELDS)
+        for invoice in invoices:
+            truck = invoice.truck + 1
+            writer.writerows((truck, code, location, f"{cost:.2f}") for code, location, cost in invoice.lines())
+
+
+def write_invoices_text(invoices, path):
+    with open(path, "w") as f:
+        for invoice in invoices:
+            f.write(f"Invoice for Truck {invoice.truck + 1}\n")
+            if invoice.unpaid:
+                f.write(f"Cannot generate invoice. Unpaid packages: {', '.join(invoice.unpaid)}\n\n")
+                continue
+            for code, location, cost in invoice.lines():
+                f.write(f"Code: {code}, Delivered to: {location}, Cost: ${cost:.2f}\n")
+            f.write(f"Total Cost: ${invoice.total:.2f}\n\n")
+
+        summary = fleet_summary(invoices)
+        f.write(f"Fleet: {summary['invoiced_trucks']} trucks invoiced, {summary['blocked_trucks']} blocked, "
+                f"{summary['packages']} packages, Total: ${summary['total']:.2f}\n")
+
+
+def write_invoices(invoices, path):
+    """CSV for .csv paths, plain text otherwise."""
+    if path.endswith(".csv"):
+        write_invoices_csv(invoices, path)
+    else:
+        write_invoices_text(invoices, path)
+    return fleet_summary(invoices)
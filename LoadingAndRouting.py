@@ -1,139 +1,255 @@
-import math
+import os
 import tkinter as tk
-from tkinter import ttk, messagebox
-import random
-import string
-
-
-# TSP Route Calculation Functions
-def euclidean_distance(coord1, coord2):
-    """Calculate the Euclidean distance between two points."""
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-def generate_distance_matrix_from_coordinates(cities, coordinates):
-    n = len(cities)
-    matrix = [[0] * n for _ in range(n)]
-    for i in range(n):
-        for j in range(n):
-            matrix[i][j] = euclidean_distance(coordinates[cities[i]], coordinates[cities[j]])
-    return matrix
-
-def tsp_greedy_with_distances(city_distances, cities):
-    visited = set()
-    route = ["Hanoi"]  # Start in Hanoi
-    while len(route) < len(cities):
-        next_city = min(
-            (city for city in cities if city not in visited),
-            key=lambda city: city_distances.get(city, float('inf'))
-        )
-        route.append(next_city)
-        visited.add(next_city)
+from itertools import islice
+from tkinter import ttk, messagebox, filedialog
+
+from Invoicing import write_invoices
+from ManifestImport import import_manifest
+from Metrics import METRICS, timed
+from Persistence import StateStore
+from TruckCore import (
+    ALLOCATION_STRATEGIES, SHIPPING_TYPES, CityRegistry, TruckManager,
+    allocate_bins, compare_dispatch, compare_strategies, nearest_neighbor_tour, route_fleet, solve_tsp,
+)
+from Workers import JobRunner
+
+
+# Packages, trucks and payments survive restarts here
+STATE_DIR = os.environ.get("TRUCK_STATE_DIR", os.path.join(os.path.expanduser("~"), ".truck_management"))
+# Optional city registry (.csv or .json); the built-in Vietnam cities otherwise
+CITY_FILE = os.environ.get("TRUCK_CITY_FILE")
+# Rapid changes within this window coalesce into one background reallocation
+REALLOCATE_DELAY_MS = 300
+# Tables with more rows than this are shown a page at a time
+VIRTUAL_THRESHOLD = 5000
+PAGE_SIZE = 500
+# How often the status bar and diagnostics window pick up new metrics
+DIAGNOSTICS_REFRESH_MS = 1000
+
+
+def package_row(package):
+    return (
+        package.package_code,
+        package.location,
+        package.weight,
+        package.distance,
+        package.shipping_type,
+        package.payment_status  # Ensure Payment Status is displayed
+    )
+
+
+class TableView:
+    """Keep a Treeview in step with its data by touching only changed rows.
+
+    Rows are (iid, values) pairs. Past `virtual_threshold` rows only the
+    current page of `page_size` rows is rendered.
+    """
+
+    def __init__(self, tree, page_size=PAGE_SIZE, virtual_threshold=VIRTUAL_THRESHOLD):
+        self.tree = tree
+        self.page_size = page_size
+        self.virtual_threshold = virtual_threshold
+        self.rendered = {}  # iid -> values currently shown
+        self.offset = 0
+        self.total = 0
+
+    @property
+    def paged(self):
+        return self.total > self.virtual_threshold
+
+    def sync(self, rows, total):
+        self.total = total
+        if self.paged:
+            last_page = max(0, total - 1) // self.page_size * self.page_size
+            self.offset = min(self.offset, last_page)
+            rows = islice(rows, self.offset, self.offset + self.page_size)
+        else:
+            self.offset = 0
+        wanted = dict(rows)
+
+        for iid in [iid for iid in self.rendered if iid not in wanted]:
+            self.tree.delete(iid)
+            del self.rendered[iid]
+
+        # Surviving rows only move if their relative order changed
+        kept = [iid for iid in wanted if iid in self.rendered]
+        if kept != list(self.tree.get_children()):
+            for index, iid in enumerate(kept):
+                self.tree.move(iid, "", index)
+
+        for index, (iid, values) in enumerate(wanted.items()):
+            shown = self.rendered.get(iid)
+            if shown is None:
+                self.tree.insert("", index, iid=iid, values=values)
+            elif shown != values:
+                self.tree.item(iid, values=values)
+        self.rendered = wanted
+
+    def update_row(self, iid, values):
+        # Single-row refresh; rows off the current page are left alone
+        if iid in self.rendered and self.rendered[iid] != values:
+            self.tree.item(iid, values=values)
+            self.rendered[iid] = values
+
+    def turn_page(self, step):
+        self.offset = max(0, self.offset + step * self.page_size)
+
+    def page_label(self):
+        if not self.total:
+            return "No rows"
+        last = min(self.total, self.offset + self.page_size) if self.paged else self.total
+        return f"Rows {self.offset + 1}-{last} of {self.total}"
+
+
+def make_pager(parent, turn):
+    """Prev/Next buttons calling turn(-1)/turn(1) around a page label, which is returned."""
+    pager = tk.Frame(parent)
+    pager.pack()
+    tk.Button(pager, text="< Prev", command=lambda: turn(-1)).grid(row=0, column=0, padx=5)
+    label = tk.Label(pager)
+    label.grid(row=0, column=1, padx=5)
+    tk.Button(pager, text="Next >", command=lambda: turn(1)).grid(row=0, column=2, padx=5)
+    return label
 
-    if route[-1] != "Hanoi":
-        route.append("Hanoi")  # Return to Hanoi
-    return route
 
 # Truck Management Application
-class Package:
-    def __init__(self, package_code, location, weight, distance, shipping_type, payment_status="Unpaid"):
-        self.package_code = package_code
-        self.location = location
-        self.weight = weight
-        self.distance = distance
-        self.shipping_type = shipping_type
-        self.payment_status = payment_status
-
-
 class TruckApp:
-    def __init__(self, root):
+    def __init__(self, root, core=None, state=None):
         self.root = root
-        self.max_weight = 25
-        self.packages = []
-        self.trucks = []
-        self.generated_codes = set()
-
-        # City coordinates for TSP
-        self.city_coordinates = {
-            "Hanoi": (21.0285, 105.8542),
-            "Da Nang": (16.0471, 108.2068),
-            "HCMC": (10.8231, 106.6297),
-            "Nha Trang": (12.2388, 109.1967),
-            "Dalat": (11.9404, 108.4583),
-            "Hai Phong": (20.8449, 106.6881),
-        }
-
-        self.packages = self.generate_packages()
-        self.trucks = self.allocate_trucks()
+        self.state = state
+        # All loading, routing and invoicing state lives in the headless core
+        self.core = TruckManager() if core is None else core
+        # Allocation and routing run in a worker pool; results come back via root.after
+        self.jobs = JobRunner(self.root.after, on_change=self.show_job_status)
+        # Fleet planning starts its own process pool, so it is driven from a thread
+        self.fleet_jobs = JobRunner(self.root.after, processes=False, max_workers=1, on_change=self.show_job_status)
+        self.core.allocator.on_drift = self.request_reallocation
+        self.reallocate_timer = None
+        self.diagnostics_view = None
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after(DIAGNOSTICS_REFRESH_MS, self.refresh_diagnostics)
+
+    def close(self):
+        self.jobs.shutdown()
+        self.fleet_jobs.shutdown()
+        if self.state is not None:
+            # Next start loads this snapshot with an empty journal
+            self.state.checkpoint()
+            self.state.close()
+        self.root.destroy()
+
+    def show_job_status(self, running=None):
+        running = self.jobs.running() + self.fleet_jobs.running()
+        self.status_var.set(f"Working: {', '.join(running)}..." if running else "Ready")
+
+    def job_failed(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def refresh_diagnostics(self):
+        try:
+            last = METRICS.last if METRICS.enabled else None
+            self.metrics_var.set(f"Last: {last[0]} {last[1] * 1e3:.1f} ms" if last else "")
+            if self.diagnostics_view is not None:
+                summary = METRICS.summary()
+                rows = [(name, (name, s["count"], s["mean_ms"], s["p95_ms"], s["max_ms"]))
+                        for name, s in summary["operations"].items()]
+                rows += [(name, (name, count, "", "", "")) for name, count in summary["counters"].items()]
+                self.diagnostics_view.sync(rows, len(rows))
+        finally:
+            self.root.after(DIAGNOSTICS_REFRESH_MS, self.refresh_diagnostics)
+
+    def show_diagnostics(self):
+        """Live per-operation counts and latencies; recording can be switched here."""
+        if self.diagnostics_view is not None:
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("600x400")
+
+        enabled = tk.BooleanVar(value=METRICS.enabled)
+        tk.Checkbutton(window, text="Record metrics", variable=enabled,
+                       command=lambda: setattr(METRICS, "enabled", enabled.get())).pack(anchor="w", padx=10, pady=5)
+
+        columns = ("Operation", "Count", "Mean ms", "p95 ms", "Max ms")
+        table = ttk.Treeview(window, columns=columns, show="headings")
+        for col in columns:
+            table.heading(col, text=col)
+            table.column(col, width=200 if col == "Operation" else 90)
+        table.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.diagnostics_view = TableView(table)
+
+        def close():
+            self.diagnostics_view = None
+            window.destroy()
+
+        buttons = tk.Frame(window)
+        buttons.pack(pady=10)
+        tk.Button(buttons, text="Reset", command=METRICS.reset).grid(row=0, column=0, padx=5)
+        tk.Button(buttons, text="Export...", command=self.export_metrics).grid(row=0, column=1, padx=5)
+        tk.Button(buttons, text="Close", command=close).grid(row=0, column=2, padx=5)
+        window.protocol("WM_DELETE_WINDOW", close)
+
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(
+            title="Export Metrics",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            METRICS.export(path)
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+
+    def request_reallocation(self):
+        """Full repack in the background; calls within REALLOCATE_DELAY_MS coalesce."""
+        if self.reallocate_timer is not None:
+            self.root.after_cancel(self.reallocate_timer)
+        self.reallocate_timer = self.root.after(REALLOCATE_DELAY_MS, self.start_reallocation)
+        self.status_var.set("Reallocation queued...")
+
+    def start_reallocation(self):
+        self.reallocate_timer = None
+        version, args = self.core.allocation_snapshot()
+        self.jobs.submit("reallocate", allocate_bins, *args,
+                         on_done=lambda bins: self.finish_reallocation(version, bins),
+                         on_error=self.job_failed)
+
+    def finish_reallocation(self, version, bins):
+        if not self.core.apply_allocation(version, bins):
+            # Packages changed while the job ran; its result is stale
+            self.request_reallocation()
+            return
+        self.update_truck_list()
+
+    def rebalance_trucks(self):
+        """Full repack of all packages, discarding the incremental allocation."""
+        self.request_reallocation()
 
-    # Other methods (generate_random_code, generate_packages, knapsack, etc.) remain unchanged...
-    def generate_random_code(self):
-        """Generate a unique 6-character alphanumeric package code."""
-        while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            if code not in self.generated_codes:
-                self.generated_codes.add(code)
-                return code
-
-    def generate_packages(self):
-        locations = [
-            {"city": "Da Nang", "distance": 767},
-            {"city": "HCMC", "distance": 1750},
-            {"city": "Nha Trang", "distance": 1300},
-            {"city": "Dalat", "distance": 1480},
-            {"city": "Hai Phong", "distance": 120},
+    def show_strategy_comparison(self):
+        _, (weights, distances, capacity, _, _, _) = self.core.allocation_snapshot()
+        self.jobs.submit("compare", compare_strategies, weights, distances, capacity, self.core.sweep_angles(),
+                         on_done=self.finish_strategy_comparison, on_error=self.job_failed)
+
+    def finish_strategy_comparison(self, results):
+        lines = [
+            f"{name}: {r['trucks']} trucks, {r['utilization']:.0%} utilization"
+            for name, r in results.items()
         ]
+        messagebox.showinfo("Allocation Strategies", "\n".join(lines))
+
+    def set_allocation_strategy(self, event=None):
+        self.core.allocation_strategy = self.strategy_var.get()
+        self.rebalance_trucks()
 
-        shipping_types = ["COD", "Bank Transfer", "Credit Card"]
-        packages = []
-        for i in range(6):
-            loc = random.choice(locations)
-            shipping_type = random.choice(shipping_types)
-            payment_status = "Pay later (COD)" if shipping_type == "COD" else "Unpaid"
-            packages.append(Package(
-                package_code=f"P{random.randint(100000, 999999)}",
-                location=loc["city"],
-                weight=random.randint(1, 10),
-                distance=loc["distance"],
-                shipping_type=shipping_type,
-                payment_status=payment_status
-            ))
-        return packages
-        
-
-    def knapsack(self, packages):
-        n = len(packages)
-        dp = [[0] * (self.max_weight + 1) for _ in range(n + 1)]
-
-        for i in range(1, n + 1):
-            for w in range(self.max_weight + 1):
-                dp[i][w] = dp[i - 1][w]
-                if packages[i - 1].weight <= w:
-                    dp[i][w] = max(dp[i][w], dp[i - 1][w - packages[i - 1].weight] + packages[i - 1].weight)
-
-        truck = []
-        w = self.max_weight
-        for i in range(n, 0, -1):
-            if dp[i][w] != dp[i - 1][w]:
-                truck.append(packages[i - 1])
-                w -= packages[i - 1].weight
-
-        remaining_packages = [p for p in packages if p not in truck]
-        truck.sort(key=lambda p: p.distance, reverse=True)
-
-        return truck, remaining_packages
-
-    def allocate_trucks(self):
-        # Allocate packages to trucks using the knapsack algorithm
-        allocated_trucks = []
-        remaining_packages = self.packages
-
-        while remaining_packages:
-            truck, remaining_packages = self.knapsack(remaining_packages)
-            allocated_trucks.append(truck)
-
-        # Sort trucks by the furthest destination (max distance in each truck)
-        allocated_trucks.sort(key=lambda truck: max(package.distance for package in truck), reverse=True)
-        return allocated_trucks
+    def selected_truck_index(self):
+        selected_item = self.truck_dropdown.selection()
+        if not selected_item:
+            messagebox.showerror("Error", "No truck selected.")
+            return None
+        return int(self.truck_dropdown.item(selected_item)["values"][0].split()[-1]) - 1
 
 
     def setup_ui(self):
@@ -144,6 +260,10 @@ class TruckApp:
             self.package_table.heading(col, text=col)
             self.package_table.column(col, width=150)  # Adjust column width for better readability
         self.package_table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.package_view = TableView(self.package_table)
+
+        # Pager for very large package tables
+        self.page_label = make_pager(self.root, self.turn_package_page)
 
         # Buttons
         btn_frame = tk.Frame(self.root)
@@ -151,6 +271,13 @@ class TruckApp:
         tk.Button(btn_frame, text="Add Package", command=self.add_package).grid(row=0, column=0, padx=5)
         tk.Button(btn_frame, text="Cancel Package", command=self.cancel_package).grid(row=0, column=1, padx=5)
         tk.Button(btn_frame, text="Confirm Payment", command=self.confirm_payment).grid(row=0, column=2, padx=5)
+        tk.Button(btn_frame, text="Rebalance Trucks", command=self.rebalance_trucks).grid(row=0, column=3, padx=5)
+        self.strategy_var = tk.StringVar(value=self.core.allocation_strategy)
+        strategy_dropdown = ttk.Combobox(btn_frame, textvariable=self.strategy_var, values=ALLOCATION_STRATEGIES, state="readonly", width=10)
+        strategy_dropdown.grid(row=0, column=4, padx=5)
+        strategy_dropdown.bind("<<ComboboxSelected>>", self.set_allocation_strategy)
+        tk.Button(btn_frame, text="Compare Strategies", command=self.show_strategy_comparison).grid(row=0, column=5, padx=5)
+        tk.Button(btn_frame, text="Import Manifest", command=self.import_manifest).grid(row=0, column=6, padx=5)
 
         # Truck list
         self.truck_dropdown = ttk.Treeview(self.root, columns=["Truck"], show="headings")
@@ -158,10 +285,16 @@ class TruckApp:
         self.truck_dropdown.column("Truck", width=300)  # Adjust column width
         self.truck_dropdown.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         self.truck_dropdown.bind("<<TreeviewSelect>>", self.display_truck)
+        self.truck_list_view = TableView(self.truck_dropdown)
+        self.truck_list_page_label = make_pager(self.root, self.turn_truck_list_page)
 
         tk.Button(self.root, text="Generate Invoice", command=self.generate_invoice).pack(pady=5)
+        tk.Button(self.root, text="Export All Invoices", command=self.export_invoices).pack(pady=5)
         tk.Button(self.root, text="Generate TSP Route", command=self.generate_tsp_route).pack(pady=5)
         tk.Button(self.root, text="Backup Route", command=self.show_backup_route).pack(pady=5)
+        tk.Button(self.root, text="Plan Fleet Routes", command=self.plan_fleet).pack(pady=5)
+        tk.Button(self.root, text="Compare Dispatch", command=self.compare_dispatch).pack(pady=5)
+        tk.Button(self.root, text="Diagnostics", command=self.show_diagnostics).pack(pady=5)
 
 
 
@@ -171,6 +304,16 @@ class TruckApp:
             self.truck_table.heading(col, text=col)
             self.truck_table.column(col, width=150)  # Adjust column width for better readability
         self.truck_table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.truck_view = TableView(self.truck_table)
+        self.truck_page_label = make_pager(self.root, self.turn_truck_page)
+
+        # Status bar: background jobs on the left, cost of the last action on the right
+        status_bar = tk.Frame(self.root, relief=tk.SUNKEN, bd=1)
+        status_bar.pack(fill=tk.X, side=tk.BOTTOM)
+        self.status_var = tk.StringVar(value="Ready")
+        tk.Label(status_bar, textvariable=self.status_var, anchor="w").pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.metrics_var = tk.StringVar()
+        tk.Label(status_bar, textvariable=self.metrics_var, anchor="e").pack(side=tk.RIGHT)
 
         self.update_package_table()
         self.update_truck_list()
@@ -181,24 +324,23 @@ class TruckApp:
         # Add Generate TSP Route button
 
     def generate_tsp_route(self):
-        selected_item = self.truck_dropdown.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "No truck selected.")
+        truck_index = self.selected_truck_index()
+        if truck_index is None:
             return
 
-        truck_index = int(self.truck_dropdown.item(selected_item)["values"][0].split()[-1]) - 1
-        truck_packages = self.trucks[truck_index]
-
-        # Extract the cities and distances for the selected truck's packages
-        truck_cities = list({pkg.location for pkg in truck_packages})  # Unique cities only
-        if "Hanoi" not in truck_cities:
-            truck_cities.insert(0, "Hanoi")  # Ensure Hanoi is the start
+        try:
+            cities = self.core.truck_cities(truck_index)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
-        # Retrieve distances from packages
-        city_distances = {pkg.location: pkg.distance for pkg in truck_packages}
+        # Solve in the pool; a newer route request supersedes this one
+        self.jobs.submit("route", solve_tsp, self.core.distances.rows(cities),
+                         on_done=lambda result: self.show_tsp_route(cities, *result),
+                         on_error=self.job_failed)
 
-        # Generate the TSP route using distances
-        optimized_route = tsp_greedy_with_distances(city_distances, truck_cities)
+    def show_tsp_route(self, cities, tour, tour_len):
+        optimized_route = [cities[i] for i in tour]
 
         # Display the optimized route
         route_window = tk.Toplevel(self.root)
@@ -207,118 +349,146 @@ class TruckApp:
         tk.Label(route_window, text="Optimized Delivery Route", font=("Arial", 14, "bold")).pack(pady=10)
         for city in optimized_route:
             tk.Label(route_window, text=city).pack(anchor="w", padx=10)
+        tk.Label(route_window, text=f"Total tour length: {tour_len:.1f} km", font=("Arial", 12, "bold")).pack(pady=10)
 
         tk.Button(route_window, text="Close", command=route_window.destroy).pack(pady=10)
 
     def show_backup_route(self):
         # Ensure a truck is selected
-        selected_item = self.truck_dropdown.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "No truck selected.")
+        truck_index = self.selected_truck_index()
+        if truck_index is None:
             return
 
-        truck_index = int(self.truck_dropdown.item(selected_item)["values"][0].split()[-1]) - 1
-        truck_packages = self.trucks[truck_index]
-
-        # Extract unique cities from truck packages
-        truck_cities = list({pkg.location for pkg in truck_packages})
-
-        if not truck_cities:
+        if not self.core.trucks[truck_index]:
             messagebox.showwarning("No Cities", "No cities assigned to the selected truck.")
             return
 
-        # Ensure all city coordinates are available
-        missing_coords = [city for city in truck_cities if city not in self.city_coordinates]
-        if missing_coords:
-            messagebox.showerror("Error", f"Missing coordinates for: {', '.join(missing_coords)}")
+        try:
+            cities = self.core.truck_cities(truck_index)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        # Start from Hanoi
-        current_city = "Hanoi"
-        route = [current_city]
-        unvisited_cities = set(truck_cities)
-
-        # Calculate route based on nearest neighbor (greedy)
-        while unvisited_cities:
-            next_city = min(
-                unvisited_cities,
-                key=lambda city: euclidean_distance(self.city_coordinates[current_city], self.city_coordinates[city])
-            )
-            route.append(next_city)
-            current_city = next_city
-            unvisited_cities.remove(next_city)
-
-        # Return to Hanoi
-        route.append("Hanoi")
+        self.jobs.submit("backup route", nearest_neighbor_tour, self.core.distances.rows(cities),
+                         on_done=lambda tour: self.show_backup_route_window([cities[i] for i in tour] + [cities[0]]),
+                         on_error=self.job_failed)
 
+    def show_backup_route_window(self, route):
         # Display the route in a new window
         route_window = tk.Toplevel(self.root)
         route_window.title("Backup Delivery Route")
         route_window.geometry("400x400")
-        tk.Label(route_window, text="Backup Route (Euclidean Distance)", font=("Arial", 14, "bold")).pack(pady=10)
+        tk.Label(route_window, text="Backup Route (Nearest Neighbor)", font=("Arial", 14, "bold")).pack(pady=10)
 
         for city in route:
             tk.Label(route_window, text=f"→ {city}").pack(anchor="w", padx=10)
 
         tk.Button(route_window, text="Close", command=route_window.destroy).pack(pady=10)
 
+    def plan_fleet(self):
+        try:
+            truck_cities = [self.core.truck_cities(i) for i in range(len(self.core.trucks))]
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        self.fleet_jobs.submit("fleet routes", route_fleet, truck_cities, self.core.city_coordinates, self.core.distances.metric,
+                               on_done=self.show_fleet_plan, on_error=self.job_failed)
+
+    def compare_dispatch(self):
+        """Fleet km of the current allocate-then-route pipeline against cluster-first dispatch."""
+        try:
+            args = self.core.dispatch_snapshot()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.fleet_jobs.submit("dispatch comparison", compare_dispatch, *args,
+                               on_done=self.show_dispatch_comparison, on_error=self.job_failed)
+
+    def show_dispatch_comparison(self, results):
+        lines = [f"{name}: {r['trucks']} trucks, {r['fleet_km']:.1f} km" for name, r in results.items()]
+        messagebox.showinfo("Dispatch Comparison", "\n".join(lines))
+
+    def show_fleet_plan(self, routes):
+        plan_window = tk.Toplevel(self.root)
+        plan_window.title("Fleet Routes")
+        plan_window.geometry("600x500")
+        fleet_km = sum(length for _, length in routes)
+        tk.Label(plan_window, text=f"{len(routes)} trucks, total fleet distance: {fleet_km:.1f} km", font=("Arial", 12, "bold")).pack(pady=10)
+
+        frame = tk.Frame(plan_window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10)
+        scrollbar = tk.Scrollbar(frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text = tk.Text(frame, yscrollcommand=scrollbar.set)
+        text.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=text.yview)
+        for i, (route, length) in enumerate(routes):
+            text.insert(tk.END, f"Truck {i + 1} ({length:.1f} km): {' → '.join(route)}\n")
+        text.config(state=tk.DISABLED)
+        tk.Button(plan_window, text="Close", command=plan_window.destroy).pack(pady=10)
+
+    @timed("ui.update_package_table")
     def update_package_table(self):
-        # Clear the package table
-        for row in self.package_table.get_children():
-            self.package_table.delete(row)
-
-        # Add updated data to the package table
-        for package in self.packages:
-            self.package_table.insert("", "end", values=(
-                package.package_code,
-                package.location,
-                package.weight,
-                package.distance,
-                package.shipping_type,
-                package.payment_status  # Ensure Payment Status is displayed
-            ))
+        # Diff against what is on screen; unchanged rows are not touched
+        packages = self.core.packages
+        rows = ((package.package_code, package_row(package)) for package in packages)
+        self.package_view.sync(rows, len(packages))
+        self.page_label.config(text=self.package_view.page_label())
         self.package_table.update_idletasks()
 
+    def turn_package_page(self, step):
+        self.package_view.turn_page(step)
+        self.update_package_table()
 
-    def update_truck_list(self):
-        # Clear the previous truck list display
-        for row in self.truck_dropdown.get_children():
-            self.truck_dropdown.delete(row)
+    @timed("ui.refresh_package")
+    def refresh_package(self, package):
+        # One package changed in place (e.g. payment status): update just its rows
+        values = package_row(package)
+        self.package_view.update_row(package.package_code, values)
+        self.truck_view.update_row(package.package_code, values)
 
+    @timed("ui.update_truck_list")
+    def update_truck_list(self):
         # Sort trucks by the furthest package inside each truck
-        sorted_trucks = sorted(enumerate(self.trucks), key=lambda x: x[1][0].distance if x[1] else 0, reverse=True)
+        sorted_trucks = sorted(enumerate(self.core.trucks), key=lambda x: x[1][0].distance if x[1] else 0, reverse=True)
 
         # Insert trucks in sorted order based on the furthest package
-        for i, truck in sorted_trucks:
-            self.truck_dropdown.insert("", "end", values=(f"Truck {i+1}",))
+        rows = ((f"truck-{i}", (f"Truck {i+1}",)) for i, truck in sorted_trucks)
+        self.truck_list_view.sync(rows, len(sorted_trucks))
+        self.truck_list_page_label.config(text=self.truck_list_view.page_label())
 
-        # Display truck packages in the truck table for the first truck
+        # Refresh the truck table for the selected truck
         self.display_truck(None)
 
+    def turn_truck_list_page(self, step):
+        self.truck_list_view.turn_page(step)
+        self.update_truck_list()
+
+    @timed("ui.display_truck")
     def display_truck(self, event):
+        if event is not None:
+            # Another truck was selected; start at its first page
+            self.truck_view.offset = 0
         selected_item = self.truck_dropdown.selection()
         if not selected_item:
+            self.truck_view.sync((), 0)
+            self.truck_page_label.config(text=self.truck_view.page_label())
             return
 
         # Get the truck number from the selected row
         truck_index = int(self.truck_dropdown.item(selected_item)["values"][0].split()[-1]) - 1
-        truck_packages = self.trucks[truck_index]
-
-        # Clear existing rows in the truck display table
-        for row in self.truck_table.get_children():
-            self.truck_table.delete(row)
-
-        # Insert packages of the selected truck, including Payment Type and Payment Status
-        for package in truck_packages:
-            self.truck_table.insert("", "end", values=(
-                package.package_code,
-                package.location,
-                package.weight,
-                package.distance,
-                package.shipping_type,
-                package.payment_status  # Display Payment Status
-            ))
-        self.package_table.update_idletasks()
+        truck_packages = self.core.trucks[truck_index]
+
+        # Packages of the selected truck, including Payment Type and Payment Status
+        rows = ((package.package_code, package_row(package)) for package in truck_packages)
+        self.truck_view.sync(rows, len(truck_packages))
+        self.truck_page_label.config(text=self.truck_view.page_label())
+        self.truck_table.update_idletasks()
+
+    def turn_truck_page(self, step):
+        self.truck_view.turn_page(step)
+        self.display_truck(None)
 
 
     def add_package(self):
@@ -333,47 +503,24 @@ class TruckApp:
 
         tk.Label(add_window, text="Destination:").pack(pady=5)
         destination_var = tk.StringVar()
-        destination_dropdown = ttk.Combobox(add_window, textvariable=destination_var, values=["HCMC", "Nha Trang", "Da Nang", "Dalat", "Hai Phong"])
+        destination_dropdown = ttk.Combobox(add_window, textvariable=destination_var, values=self.core.cities.destinations())
         destination_dropdown.pack(pady=5)
 
         tk.Label(add_window, text="Payment Type:").pack(pady=5)
         payment_type_var = tk.StringVar()
-        payment_type_dropdown = ttk.Combobox(add_window, textvariable=payment_type_var, values=["COD", "Bank Transfer", "Credit Card"])
+        payment_type_dropdown = ttk.Combobox(add_window, textvariable=payment_type_var, values=SHIPPING_TYPES)
         payment_type_dropdown.pack(pady=5)
 
         def confirm_add():
             try:
-                weight = int(weight_entry.get())
-                if weight < 1 or weight > 10:
-                    raise ValueError("Invalid weight")
-                destination = destination_var.get()
-                if destination not in ["HCMC", "Nha Trang", "Da Nang", "Dalat", "Hai Phong"]:
-                    raise ValueError("Invalid destination")
-                payment_type = payment_type_var.get()
-                if payment_type not in ["COD", "Bank Transfer", "Credit Card"]:
-                    raise ValueError("Invalid payment type")
-                
-                # Set the payment status based on the payment type
-                payment_status = "Pay later (COD)" if payment_type == "COD" else "Unpaid"
-                
-                # Generate a random unique code for the package
-                package_code = self.generate_random_code()
-
-                # Create the new package
-                new_package = Package(
-                    package_code, 
-                    destination, 
-                    weight, 
-                    random.randint(500, 2000),
-                    payment_type,
-                    payment_status
-                )
-                self.packages.append(new_package)
-                
-                # Update trucks and UI
-                self.trucks = self.allocate_trucks()
-                self.update_package_table()
-                self.update_truck_list()
+                # Timed without the dialogs, which wait on the user
+                with METRICS.time("ui.add_package"):
+                    weight = int(weight_entry.get())
+                    new_package = self.core.add_package(weight, destination_var.get(), payment_type_var.get())
+
+                    # Update UI (only trucks with spare capacity were touched)
+                    self.update_package_table()
+                    self.update_truck_list()
 
                 messagebox.showinfo("Success", f"Package {new_package.package_code} added successfully.")
                 add_window.destroy()
@@ -383,24 +530,62 @@ class TruckApp:
         tk.Button(add_window, text="Add", command=confirm_add).pack(pady=10)
         tk.Button(add_window, text="Cancel", command=add_window.destroy).pack(pady=5)
     
+    def import_manifest(self):
+        path = filedialog.askopenfilename(
+            title="Import Manifest",
+            filetypes=[("Manifests", "*.csv *.jsonl *.ndjson"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        try:
+            report = import_manifest(self.core, path, reallocate=False)
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        # One table refresh for the whole manifest; trucks follow when the
+        # background reallocation finishes
+        self.update_package_table()
+        if report.added:
+            self.request_reallocation()
+
+        if not report.error_count:
+            messagebox.showinfo("Import Manifest", report.summary())
+            return
+
+        # Rejected rows go into one scrollable report instead of a popup each
+        report_window = tk.Toplevel(self.root)
+        report_window.title("Import Report")
+        report_window.geometry("600x400")
+        tk.Label(report_window, text=report.summary(), font=("Arial", 12, "bold")).pack(pady=10)
+        frame = tk.Frame(report_window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10)
+        scrollbar = tk.Scrollbar(frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text = tk.Text(frame, yscrollcommand=scrollbar.set)
+        text.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=text.yview)
+        for line_no, message in report.errors:
+            text.insert(tk.END, f"Line {line_no}: {message}\n")
+        if report.error_count > len(report.errors):
+            text.insert(tk.END, f"... {report.error_count - len(report.errors)} more\n")
+        text.config(state=tk.DISABLED)
+        tk.Button(report_window, text="Close", command=report_window.destroy).pack(pady=10)
+
     def cancel_package(self):
         selected_item = self.package_table.selection()
         if not selected_item:
             messagebox.showerror("Error", "No package selected to cancel")
             return
 
-        # Get the selected package's index
-        package_index = self.package_table.index(selected_item[0])
-        canceled_package = self.packages[package_index]
+        # Timed without the dialogs, which wait on the user
+        with METRICS.time("ui.cancel_package"):
+            # Row ids are package codes
+            canceled_package = self.core.cancel_package(selected_item[0])
 
-        # Remove the package and its code from tracking
-        del self.packages[package_index]
-        self.generated_codes.discard(canceled_package.package_code)
-
-        # Reallocate packages and update truck list
-        self.trucks = self.allocate_trucks()
-        self.update_package_table()
-        self.update_truck_list()
+            self.update_package_table()
+            self.update_truck_list()
 
         # Success message
         messagebox.showinfo("Success", f"Package {canceled_package.package_code} has been successfully canceled.")
@@ -411,45 +596,29 @@ class TruckApp:
             messagebox.showerror("Error", "No package selected for payment confirmation.")
             return
 
-        package_index = self.package_table.index(selected_item[0])
-        package = self.packages[package_index]
+        package = self.core.find_package(selected_item[0])
 
         if package.payment_status == "Pay later (COD)":  # COD payments are automatically valid
             messagebox.showinfo("Info", f"Package {package.package_code} is already set as Pay later (COD).")
-        elif package.shipping_type == "COD":
-            package.payment_status = "Pay later (COD)"
-        else:
-            package.payment_status = "Paid"
+        with METRICS.time("ui.confirm_payment"):
+            self.core.confirm_payment(package.package_code)
 
-        self.update_package_table()
-        self.update_truck_list()
+            # Only the status cell changed; trucks are unaffected
+            self.refresh_package(package)
         messagebox.showinfo("Success", f"Package {package.package_code} payment confirmed.")
     
     def generate_invoice(self):
         # Validate the selected truck
-        selected_item = self.truck_dropdown.selection()
-        if not selected_item:
-            messagebox.showerror("Error", "No truck selected.")
+        truck_index = self.selected_truck_index()
+        if truck_index is None:
             return
 
-        # Get the selected truck
-        truck_index = int(self.truck_dropdown.item(selected_item)["values"][0].split()[-1]) - 1
-        truck_packages = self.trucks[truck_index]
-
-        # Check if all packages are Paid or Pay later (COD)
-        unpaid_packages = [p for p in truck_packages if p.payment_status not in ("Paid", "Pay later (COD)")]
-        if unpaid_packages:
-            unpaid_codes = ", ".join(p.package_code for p in unpaid_packages)
-            messagebox.showerror("Error", f"Cannot generate invoice. Unpaid packages: {unpaid_codes}")
+        # Costs are only computed if all packages are Paid or Pay later (COD)
+        invoice = self.core.invoice_fleet(trucks=[truck_index])[0]
+        if invoice.unpaid:
+            messagebox.showerror("Error", f"Cannot generate invoice. Unpaid packages: {', '.join(invoice.unpaid)}")
             return
 
-        # Calculate the cost for each package and the total
-        package_costs = [
-            (p.package_code, p.location, (p.weight * p.distance * 0.05) + 100)
-            for p in truck_packages
-        ]
-        total_cost = sum(cost for _, _, cost in package_costs)
-
         # Display the invoice in a new pop-up window
         invoice_window = tk.Toplevel(self.root)
         invoice_window.title("Invoice")
@@ -459,19 +628,61 @@ class TruckApp:
         tk.Label(invoice_window, text=f"Invoice for Truck {truck_index + 1}", font=("Arial", 14, "bold")).pack(pady=10)
         tk.Label(invoice_window, text="Packages Included:", font=("Arial", 12)).pack(pady=5)
 
-        # Display each package's details
-        for package_code, location, cost in package_costs:
-            tk.Label(invoice_window, text=f"Code: {package_code}, Delivered to: {location}, Cost: ${cost:.2f}").pack(anchor="w", padx=10)
+        # One scrollable table, paged past VIRTUAL_THRESHOLD lines, instead of a label per package
+        frame = tk.Frame(invoice_window)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10)
+        table = ttk.Treeview(frame, columns=("Code", "Delivered to", "Cost"), show="headings")
+        for col in ("Code", "Delivered to", "Cost"):
+            table.heading(col, text=col)
+            table.column(col, width=150)
+        scrollbar = ttk.Scrollbar(frame, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        table.pack(fill=tk.BOTH, expand=True)
+        view = TableView(table)
+
+        def show_page(step=0):
+            view.turn_page(step)
+            rows = ((code, (code, location, f"${cost:.2f}")) for code, location, cost in invoice.lines())
+            view.sync(rows, len(invoice))
+            page_label.config(text=view.page_label())
+
+        page_label = make_pager(invoice_window, show_page)
+        show_page()
 
         # Display the total cost
-        tk.Label(invoice_window, text=f"Total Cost: ${total_cost:.2f}", font=("Arial", 12, "bold")).pack(pady=20)
-
-        # Close button
-        tk.Button(invoice_window, text="Close", command=invoice_window.destroy).pack(pady=10)
-
+        tk.Label(invoice_window, text=f"Total Cost: ${invoice.total:.2f}", font=("Arial", 12, "bold")).pack(pady=20)
+
+        buttons = tk.Frame(invoice_window)
+        buttons.pack(pady=10)
+        tk.Button(buttons, text="Save...", command=lambda: self.save_invoices([invoice])).grid(row=0, column=0, padx=5)
+        tk.Button(buttons, text="Close", command=invoice_window.destroy).grid(row=0, column=1, padx=5)
+
+    def export_invoices(self):
+        """Invoice every truck into one file."""
+        self.save_invoices(self.core.invoice_fleet())
+
+    def save_invoices(self, invoices):
+        path = filedialog.asksaveasfilename(
+            title="Save Invoices",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("Text", "*.txt"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            summary = write_invoices(invoices, path)
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        messagebox.showinfo("Invoices", f"{summary['invoiced_trucks']} trucks invoiced, "
+                                        f"{summary['blocked_trucks']} blocked by unpaid packages, "
+                                        f"Total: ${summary['total']:.2f}")
 
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = TruckApp(root)
+    state = StateStore(STATE_DIR)
+    cities = CityRegistry.from_file(CITY_FILE) if CITY_FILE else None
+    app = TruckApp(root, core=state.load(cities=cities), state=state)
     root.mainloop()
@@ -0,0 +1,161 @@
+"""Streaming import of package manifests (CSV or JSON lines).
+
+Rows flow through generators (read -> parse/validate -> batch), so memory
+stays bounded by the batch size plus the packages actually kept. Bad rows
+are collected in an ImportReport instead of stopping the import.
+"""
+import csv
+import json
+from itertools import islice
+
+from TruckCore import DEFAULT_CITIES, Package, payment_status_for, validate_package
+
+IMPORT_BATCH_SIZE = 10_000
+# Errors kept with their messages; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# Road km from the depot; anything longer is a data error
+MAX_DISTANCE_KM = 100_000
+
+
+class ImportReport:
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.added = 0
+        self.error_count = 0
+        self.errors = []  # (line number, message)
+        self.max_errors = max_errors
+
+    def error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line_no, message))
+
+    def summary(self):
+        return f"{self.added} packages imported, {self.error_count} rows rejected"
+
+
+def read_rows(path):
+    """Yield (line number, row dict) from a .csv (header row) or .jsonl manifest.
+
+    Rows the reader cannot parse are yielded as the exception instead of a
+    dict. Undecodable bytes are replaced, so such rows fail validation.
+    """
+    with open(path, newline="", errors="replace") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = e
+                yield line_no, row
+        else:
+            reader = csv.DictReader(f)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    row = e
+                yield reader.line_num, row
+
+
+def text_field(row, *names):
+    """The first non-empty of `names`, or None; ValueError unless it is a string."""
+    for name in names:
+        value = row.get(name)
+        if value is None or value == "":
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f"Invalid {name.replace('_', ' ')}")
+        return value
+    return None
+
+
+def int_field(row, name):
+    """Whole numbers only, as the dialog's int(entry): text or a JSON integer, not 3.9 or true."""
+    value = row.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Invalid {name}")
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}")
+
+
+def parse_rows(rows, report, code_in_use, generate_code, cities=DEFAULT_CITIES):
+    """Validate rows like the Add Package dialog and yield Package objects.
+
+    Every field must be text (or, in JSON lines, an integer for the numbers).
+    `code_in_use(code)` answers for codes already taken (see
+    TruckManager.code_in_use). Only codes the manifest brings itself are
+    remembered here, so duplicates inside it are rejected too; generated
+    codes are tracked by the allocator.
+    """
+    manifest_codes = set()
+    for line_no, row in rows:
+        try:
+            if not isinstance(row, dict):
+                raise ValueError(f"Malformed row: {row}")
+            weight = int_field(row, "weight")
+            destination = text_field(row, "location", "destination")
+            payment_type = text_field(row, "shipping_type", "payment_type")
+            validate_package(weight, destination, payment_type, cities)
+            payment_status = payment_status_for(payment_type, text_field(row, "payment_status"))
+
+            if row.get("distance") in (None, ""):
+                distance = cities.distance_from_depot(destination)
+            else:
+                distance = int_field(row, "distance")
+                if not 0 <= distance <= MAX_DISTANCE_KM:
+                    raise ValueError("Invalid distance")
+
+            package_code = text_field(row, "package_code")
+            if package_code is None:
+                package_code = generate_code()
+                while package_code in manifest_codes:
+                    package_code = generate_code()
+            elif not package_code.isprintable() or not package_code.strip():
+                raise ValueError("Invalid package code")
+            elif package_code in manifest_codes or code_in_use(package_code):
+                raise ValueError(f"Duplicate package code {package_code}")
+            else:
+                manifest_codes.add(package_code)
+        except ValueError as e:
+            report.error(line_no, str(e))
+            continue
+
+        yield Package(
+            package_code,
+            destination,
+            weight,
+            distance,
+            payment_type,
+            payment_status
+        )
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_manifest(manager, path, batch_size=IMPORT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS, reallocate=True):
+    """Stream a manifest into `manager` and reallocate once at the end.
+
+    Pass reallocate=False when the caller schedules the reallocation itself.
+    """
+    report = ImportReport(max_errors)
+    packages = parse_rows(read_rows(path), report, manager.code_in_use, manager.generate_random_code, manager.cities)
+    for batch in batched(packages, batch_size):
+        manager.import_packages(batch)
+        report.added += len(batch)
+
+    if report.added and reallocate:
+        manager.rebalance_trucks()
+    return report
@@ -0,0 +1,135 @@
+"""Per-operation counters and latency histograms.
+
+    @timed("allocate_trucks")
+    def allocate_trucks(...): ...
+
+    METRICS.enabled = True      # switchable at runtime; off costs one attribute check per call
+    METRICS.export("metrics.json")
+
+Latencies go into power-of-two microsecond buckets, so a histogram is a
+fixed list of ints however many calls it records. Jobs run in worker
+processes are timed by the JobRunner that submitted them (see Workers).
+"""
+import json
+import os
+import time
+from functools import wraps
+
+# Bucket i holds latencies in [2**(i-1), 2**i) microseconds; the last one is open-ended
+HISTOGRAM_BUCKETS = 40
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        """Upper bound in seconds of the bucket holding the q-th quantile (0 < q <= 1)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1e3, 3),
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5) * 1e3, 3),
+            "p95_ms": round(self.percentile(0.95) * 1e3, 3),
+            "p99_ms": round(self.percentile(0.99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+            "buckets_us": {1 << i: n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Metrics:
+    """Counters and latency histograms by operation name; nothing is recorded while disabled."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.last = None  # (name, seconds) of the latest timed operation
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+        self.last = (name, seconds)
+
+    def time(self, name):
+        """Context manager timing its body under `name`."""
+        return _Timer(self, name)
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+        self.last = None
+
+    def summary(self):
+        return {
+            "operations": {name: h.summary() for name, h in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump({"exported_at": time.time(), **self.summary()}, f, indent=2)
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if self.metrics.enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# Process-wide instance; TRUCK_METRICS=1 turns it on at startup
+METRICS = Metrics(enabled=os.environ.get("TRUCK_METRICS") == "1")
+
+
+def timed(name, metrics=METRICS):
+    """Decorator recording each call's latency under `name` while `metrics` is enabled."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,227 @@
+"""Snapshots plus an append-only journal, so restarts keep their state.
+
+A snapshot is one binary file: a small JSON header, the package codes as
+a JSON array, then the raw bytes of every PackageStore column and of the
+truck allocation (row positions). Loading memory-maps it and copies each section straight into
+an array, with no per-package parsing. Every add/cancel/pay/rebalance and
+bulk-import batch after the snapshot is appended to a JSON-lines journal;
+on startup only that tail is replayed. A checkpoint writes a new snapshot
+and truncates the journal.
+"""
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from Metrics import METRICS, timed
+from TruckCore import CodeAllocator, Package, PackageStore, TruckManager
+
+SNAPSHOT_FILE = "snapshot.bin"
+JOURNAL_FILE = "journal.log"
+# Version 2 stores the package codes as a JSON array
+SNAPSHOT_MAGIC = b"TRKSNAP2"
+# Journal entries after which a checkpoint is written automatically
+CHECKPOINT_EVERY = 10_000
+
+_SECTION = struct.Struct("<Q")
+
+
+class StateStore:
+    """Persistent home of one TruckManager.
+
+        state = StateStore("truck_state")
+        manager = state.load()      # snapshot + journal replay, journaling from now on
+        ...
+        state.checkpoint()
+
+    Set fsync=True to make every journal entry durable before returning.
+    """
+
+    def __init__(self, directory, checkpoint_every=CHECKPOINT_EVERY, fsync=False):
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.manager = None
+        self.seq = 0
+        self.pending = 0  # journal entries since the last checkpoint
+        self.journal_file = None
+        os.makedirs(directory, exist_ok=True)
+
+    @timed("state.load")
+    def load(self, **manager_options):
+        """Latest snapshot plus journal tail; a fresh TruckManager if there is none."""
+        fresh = not os.path.exists(self.snapshot_path)
+        if fresh:
+            # A journal without a snapshot predates the first checkpoint; start over
+            manager = TruckManager(**manager_options)
+        else:
+            manager = self._read_snapshot(manager_options)
+            self._replay(manager)
+        self.attach(manager)
+        # Packages imported in bulk but not yet allocated when we stopped; journaled
+        # so later entries replay onto this allocation
+        if len(manager.allocator.truck_of) != len(manager.packages):
+            manager.rebalance_trucks()
+        if fresh:
+            self.checkpoint()
+        return manager
+
+    def attach(self, manager):
+        self.manager = manager
+        manager.journal = self
+        self.journal_file = open(self.journal_path, "a")
+
+    def record(self, op, fields):
+        self.seq += 1
+        self.journal_file.write(json.dumps({"seq": self.seq, "op": op, **fields}) + "\n")
+        self.journal_file.flush()
+        METRICS.count("journal.entries")
+        if self.fsync:
+            os.fsync(self.journal_file.fileno())
+        self.pending += 1
+
+    def settle(self):
+        """Called by the manager once an operation has fully applied; checkpoints when due."""
+        if self.pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    @timed("state.checkpoint")
+    def checkpoint(self):
+        """Write a snapshot of the attached manager and start an empty journal."""
+        self._write_snapshot(self.manager)
+        # Entries up to self.seq are in the snapshot; replay skips them even
+        # if we stop before the truncate below
+        self.journal_file.close()
+        self.journal_file = open(self.journal_path, "w")
+        self.pending = 0
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+        if self.manager is not None:
+            self.manager.journal = None
+
+    def _write_snapshot(self, manager):
+        store = manager.packages
+        store.compact()
+        truck_sizes = array("L", (len(truck) for truck in manager.trucks))
+        truck_rows = array("L", (store.row_of[p.package_code] for truck in manager.trucks for p in truck))
+        header = {
+            "seq": self.seq,
+            "max_weight": manager.max_weight,
+            "allocation_strategy": manager.allocation_strategy,
+            "improve_packing": manager.improve_packing,
+            "locations": store.locations.values,
+            "shipping_types": store.shipping_types.values,
+            "statuses": store.statuses.values,
+            "code_key": manager.codes.key,
+            "code_counter": manager.codes.counter,
+            "typecodes": {name: getattr(store, name).typecode for name in store.COLUMNS},
+        }
+        sections = [json.dumps(header).encode(), json.dumps(store.codes).encode()]
+        sections += [getattr(store, name).tobytes() for name in store.COLUMNS]
+        sections += [truck_sizes.tobytes(), truck_rows.tobytes(), bytes(manager.codes.issued)]
+
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            for section in sections:
+                f.write(_SECTION.pack(len(section)))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _read_snapshot(self, manager_options):
+        with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"{self.snapshot_path} is not a truck state snapshot")
+            sections = []
+            offset = len(SNAPSHOT_MAGIC)
+            while offset < len(mm):
+                (size,) = _SECTION.unpack_from(mm, offset)
+                offset += _SECTION.size
+                sections.append(mm[offset:offset + size])
+                offset += size
+
+        header = json.loads(sections[0])
+        codes = json.loads(sections[1])
+        columns = {}
+        for name, section in zip(PackageStore.COLUMNS, sections[2:]):
+            columns[name] = array(header["typecodes"][name], section)
+        truck_sizes = array("L", sections[7])
+        flat_rows = array("L", sections[8])
+
+        store = PackageStore.from_columns(codes, columns, header["locations"],
+                                          header["shipping_types"], header["statuses"])
+        truck_rows = []
+        start = 0
+        for size in truck_sizes:
+            truck_rows.append(flat_rows[start:start + size])
+            start += size
+
+        options = {
+            "max_weight": header["max_weight"],
+            "allocation_strategy": header["allocation_strategy"],
+            "improve_packing": header["improve_packing"],
+            **manager_options,
+        }
+        manager = TruckManager(packages=store, truck_rows=truck_rows, **options)
+        manager.codes = CodeAllocator(header["code_key"], header["code_counter"], sections[9])
+        self.seq = header["seq"]
+        return manager
+
+    def _replay(self, manager):
+        if not os.path.exists(self.journal_path):
+            return
+        # Only rebalance where the journal says a rebalance happened
+        on_drift, manager.allocator.on_drift = manager.allocator.on_drift, lambda: None
+        end = 0  # byte offset just past the last complete entry
+        try:
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn final write
+                    end += len(line)
+                    if entry["seq"] <= self.seq:
+                        continue
+                    self._apply(manager, entry)
+                    self.seq = entry["seq"]
+                    self.pending += 1
+        finally:
+            manager.allocator.on_drift = on_drift
+        # Cut a torn tail off, or the next entry would be appended to it
+        if end < os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(end)
+
+    def _apply(self, manager, entry):
+        op = entry["op"]
+        if op == "add":
+            package = Package(**entry["package"])
+            manager.codes.claim(package.package_code)
+            manager.insert_package(package)
+        elif op == "cancel":
+            manager.cancel_package(entry["code"])
+        elif op == "pay":
+            manager.confirm_payment(entry["code"])
+        elif op == "rebalance":
+            manager.allocation_strategy = entry["strategy"]
+            manager.improve_packing = entry["improve"]
+            manager.rebalance_trucks()
+        elif op == "import":
+            packages = [Package(**fields) for fields in entry["packages"]]
+            # Manifest rows without a code were given one by the allocator
+            for package in packages:
+                manager.codes.claim(package.package_code)
+            manager.import_packages(packages)
+        else:
+            raise ValueError(f"Unknown journal entry: {op}")
@@ -0,0 +1,123 @@
+"""Allocate and route a package file without the UI.
+
+    python TruckCLI.py packages.csv -o plan.json --strategy bfd
+
+Input is CSV (header row) or JSON (a list of objects) with the Package
+fields: package_code, location, weight, distance, shipping_type and
+optionally payment_status.
+"""
+import argparse
+import csv
+import json
+import sys
+
+from Invoicing import load_tariff, write_invoices
+from Metrics import METRICS
+from TruckCore import ALLOCATION_STRATEGIES, CityRegistry, Package, TruckManager, payment_status_for
+
+
+def read_packages(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    packages = []
+    for row in rows:
+        shipping_type = row["shipping_type"]
+        packages.append(Package(
+            package_code=row["package_code"],
+            location=row["location"],
+            weight=int(row["weight"]),
+            distance=int(row["distance"]),
+            shipping_type=shipping_type,
+            payment_status=payment_status_for(shipping_type, row.get("payment_status") or None)
+        ))
+    return packages
+
+
+def plan(manager, route=True, workers=None):
+    """Trucks with their packages, load and (optionally) route, as plain dicts."""
+    trucks = []
+    for i, truck in enumerate(manager.trucks):
+        trucks.append({
+            "truck": i + 1,
+            "load": sum(p.weight for p in truck),
+            "packages": [p.package_code for p in truck],
+        })
+    if route:
+        # Every truck is routed in parallel across processes
+        routes, fleet_km = manager.plan_fleet(workers)
+        for entry, (cities, length) in zip(trucks, routes):
+            entry["route"], entry["tour_length_km"] = cities, length
+
+    result = {"trucks": trucks, "summary": {
+        "packages": len(manager.packages),
+        "trucks": len(trucks),
+        "strategy": manager.allocation_strategy,
+    }}
+    if route:
+        result["summary"]["fleet_km"] = fleet_km
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Allocate packages to trucks and route them from the depot.")
+    parser.add_argument("packages", help="package file (.csv or .json)")
+    parser.add_argument("-o", "--output", help="write the plan as JSON here instead of stdout")
+    parser.add_argument("--max-weight", type=int, default=25)
+    parser.add_argument("--strategy", choices=ALLOCATION_STRATEGIES, default="knapsack")
+    parser.add_argument("--improve", action="store_true", help="run the local-search pass after ffd/bfd")
+    parser.add_argument("--no-routes", action="store_true", help="allocate only")
+    parser.add_argument("--cities", help="city registry (.csv or .json) instead of the built-in cities")
+    parser.add_argument("--compare-dispatch", action="store_true",
+                        help="also report trucks and fleet km of cluster-first dispatch against --strategy")
+    parser.add_argument("--workers", type=int, help="routing processes (default: one per core)")
+    parser.add_argument("--invoices", help="write every truck's invoice here (.csv, or plain text)")
+    parser.add_argument("--tariff", help="JSON tariff table used for the invoices")
+    parser.add_argument("--metrics", help="record operation counts and latencies and write them here as JSON")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        METRICS.enabled = True
+    try:
+        packages = read_packages(args.packages)
+    except (OSError, KeyError, ValueError) as e:
+        parser.error(f"cannot read {args.packages}: {e}")
+
+    try:
+        tariff = load_tariff(args.tariff) if args.tariff else None
+    except (OSError, KeyError, ValueError) as e:
+        parser.error(f"cannot read {args.tariff}: {e}")
+    try:
+        cities = CityRegistry.from_file(args.cities) if args.cities else None
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read {args.cities}: {e}")
+
+    try:
+        manager = TruckManager(max_weight=args.max_weight, packages=packages,
+                               allocation_strategy=args.strategy, improve_packing=args.improve, tariff=tariff, cities=cities)
+        result = plan(manager, route=not args.no_routes, workers=args.workers)
+        if args.compare_dispatch:
+            result["summary"]["dispatch"] = manager.compare_dispatch(max_workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.invoices:
+        result["summary"]["invoices"] = write_invoices(manager.invoice_fleet(), args.invoices)
+
+    if args.metrics:
+        METRICS.export(args.metrics)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
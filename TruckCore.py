@@ -0,0 +1,1778 @@
+"""Headless truck loading, routing and invoicing; no tkinter import."""
+import csv
+import heapq
+import json
+import math
+import os
+import random
+import string
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+
+from Metrics import METRICS, timed
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python paths are used instead
+    np = None
+
+# Above this many DP cells (packages x capacity) the knapsack switches to greedy
+KNAPSACK_EXACT_LIMIT = 50_000_000
+
+# "knapsack" fills one truck at a time; "ffd"/"bfd" pack the whole fleet by weight;
+# "cluster" packs by bearing from the depot so each truck serves one region
+ALLOCATION_STRATEGIES = ("knapsack", "ffd", "bfd", "cluster")
+
+# Routes with at most this many stops (depot included) are solved exactly
+HELD_KARP_LIMIT = 12
+# Candidate neighbors per city for 2-opt / Or-opt
+NEIGHBOR_LIST_SIZE = 10
+# Distance matrices kept by DistanceService before the least recently used is evicted
+DISTANCE_CACHE_SIZE = 128
+# Items the sweep may skip over while topping up a truck before closing it
+SWEEP_LOOKAHEAD = 128
+# Larger routes skip the dense matrix: distances on demand, neighbors from a k-d tree
+DENSE_ROUTE_LIMIT = 200
+EARTH_RADIUS_KM = 6371.0
+
+
+# TSP Route Calculation Functions
+def euclidean_distance(coord1, coord2):
+    """Calculate the Euclidean distance between two points."""
+    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
+def haversine_distance(coord1, coord2):
+    """Great-circle distance in km between two (lat, lon) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*coord1, *coord2))
+    a = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def generate_distance_matrix_from_coordinates(cities, coordinates, metric="euclidean"):
+    return DistanceMatrix.build(cities, coordinates, metric).rows()
+
+class DistanceMatrix:
+    """Symmetric distances over `cities`, storing only the upper triangle as float32."""
+
+    def __init__(self, cities, triangle):
+        self.cities = list(cities)
+        self.index = {city: i for i, city in enumerate(self.cities)}
+        self.triangle = triangle
+
+    @classmethod
+    def build(cls, cities, coordinates, metric="euclidean"):
+        cities = list(cities)
+        n = len(cities)
+        if np is not None:
+            points = np.array([coordinates[c] for c in cities], dtype=np.float64).reshape(n, 2)
+            upper = np.triu_indices(n, 1)
+            if metric == "haversine":
+                lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+                a = (np.sin((lat[:, None] - lat[None, :]) / 2)**2
+                     + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[:, None] - lon[None, :]) / 2)**2)
+                full = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+            else:
+                full = np.sqrt(((points[:, None, :] - points[None, :, :])**2).sum(axis=2))
+            return cls(cities, full[upper].astype(np.float32))
+
+        distance = haversine_distance if metric == "haversine" else euclidean_distance
+        points = [coordinates[c] for c in cities]
+        triangle = array("f", (distance(points[i], points[j]) for i in range(n) for j in range(i + 1, n)))
+        return cls(cities, triangle)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _offset(self, i, j):
+        n = len(self.cities)
+        return i * (2 * n - i - 1) // 2 + (j - i - 1)
+
+    def get(self, i, j):
+        if i == j:
+            return 0.0
+        if i > j:
+            i, j = j, i
+        return float(self.triangle[self._offset(i, j)])
+
+    def distance(self, city1, city2):
+        return self.get(self.index[city1], self.index[city2])
+
+    def rows(self, order=None):
+        """Dense list-of-lists for the solvers, optionally in another city order."""
+        order = self.cities if order is None else order
+        idx = [self.index[c] for c in order]
+        return [[self.get(i, j) for j in idx] for i in idx]
+
+class DistanceService:
+    """Shared distance matrices, cached per city set with LRU eviction."""
+
+    def __init__(self, coordinates, metric="euclidean", max_entries=DISTANCE_CACHE_SIZE):
+        self.coordinates = coordinates
+        self.metric = metric
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+
+    def matrix(self, cities):
+        key = tuple(sorted(set(cities)))
+        matrix = self.cache.get(key)
+        if matrix is not None:
+            METRICS.count("distance_cache.hit")
+            self.cache.move_to_end(key)
+            return matrix
+        METRICS.count("distance_cache.miss")
+        matrix = DistanceMatrix.build(key, self.coordinates, self.metric)
+        self.cache[key] = matrix
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return matrix
+
+    def rows(self, cities):
+        # Dense matrix in the caller's order (e.g. depot first) for solve_tsp
+        if len(cities) > DENSE_ROUTE_LIMIT:
+            return PointDistances([self.coordinates[c] for c in cities], self.metric)
+        return self.matrix(cities).rows(cities)
+
+    def clear(self):
+        self.cache.clear()
+
+def spatial_key(coord, metric="haversine"):
+    """Point whose Euclidean distances order like `metric`: a unit vector for (lat, lon)."""
+    if metric != "haversine":
+        return tuple(coord)
+    lat, lon = math.radians(coord[0]), math.radians(coord[1])
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+class KDTree:
+    """Static k-d tree for nearest-neighbor queries, with point removal.
+
+    Nodes are the midpoints of ranges of `order`, so the tree is three flat
+    lists. `live` counts the points left under each node, letting queries
+    skip subtrees that have been emptied by remove().
+    """
+
+    def __init__(self, points):
+        self.points = [tuple(p) for p in points]
+        n = len(self.points)
+        dims = len(self.points[0]) if n else 1
+        self.order = list(range(n))
+        self.axis = bytearray(n)
+        self.live = [0] * n
+        self.removed = bytearray(n)
+        stack = [(0, n, 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            axis = depth % dims
+            self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: self.points[i][axis])
+            self.axis[mid] = axis
+            self.live[mid] = hi - lo
+            stack += [(lo, mid, depth + 1), (mid + 1, hi, depth + 1)]
+        self.position = [0] * n
+        for pos, i in enumerate(self.order):
+            self.position[i] = pos
+
+    def __len__(self):
+        return self.live[len(self.points) // 2] if self.points else 0
+
+    def remove(self, i):
+        pos = self.position[i]
+        if self.removed[pos]:
+            return
+        self.removed[pos] = 1
+        lo, hi = 0, len(self.points)
+        while True:
+            mid = (lo + hi) // 2
+            self.live[mid] -= 1
+            if mid == pos:
+                return
+            if pos < mid:
+                hi = mid
+            else:
+                lo = mid + 1
+
+    def nearest(self, point, k=1):
+        """Up to k (squared distance, index) pairs, closest first."""
+        heap = []  # (-d2, index): the worst kept candidate on top
+        points, order, axes, live, removed = self.points, self.order, self.axis, self.live, self.removed
+
+        def visit(lo, hi):
+            mid = (lo + hi) // 2
+            if lo >= hi or not live[mid]:
+                return
+            i = order[mid]
+            q = points[i]
+            if not removed[mid]:
+                d2 = sum((a - b) ** 2 for a, b in zip(point, q))
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d2, i))
+                elif d2 < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d2, i))
+            diff = point[axes[mid]] - q[axes[mid]]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            visit(*near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(*far)
+
+        visit(0, len(points))
+        return sorted((-d2, i) for d2, i in heap)
+
+class PointDistances:
+    """Matrix stand-in for large routes: matrix[i][j] is computed from coordinates.
+
+    Memory is O(n) instead of O(n^2); the solvers take neighbor candidates
+    and the nearest-neighbor tour from a KDTree over the same points.
+    """
+
+    def __init__(self, points, metric="haversine"):
+        self.points = list(points)
+        self.metric = metric
+        # Great-circle km from the chord between unit vectors: one sqrt and asin per pair
+        self.keys = [spatial_key(p, metric) for p in self.points]
+        self._rows = [_PointRow(self, i) for i in range(len(self.points))]
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, i):
+        return self._rows[i]
+
+    def spatial_index(self):
+        """A fresh KDTree over the points (callers may remove from it)."""
+        return KDTree(self.keys)
+
+class _PointRow:
+    __slots__ = ("owner", "key")
+
+    def __init__(self, owner, i):
+        self.owner = owner
+        self.key = owner.keys[i]
+
+    def __getitem__(self, j):
+        owner = self.owner
+        chord = math.dist(self.key, owner.keys[j])
+        if owner.metric != "haversine":
+            return chord
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def tsp_greedy_with_distances(city_distances, cities):
+    visited = set()
+    route = ["Hanoi"]  # Start in Hanoi
+    while len(route) < len(cities):
+        next_city = min(
+            (city for city in cities if city not in visited),
+            key=lambda city: city_distances.get(city, float('inf'))
+        )
+        route.append(next_city)
+        visited.add(next_city)
+
+    if route[-1] != "Hanoi":
+        route.append("Hanoi")  # Return to Hanoi
+    return route
+
+@timed("solve_tsp")
+def solve_tsp(matrix, start=0, exact_limit=HELD_KARP_LIMIT):
+    """Shortest closed tour over every index of `matrix`, starting at `start`.
+
+    Small instances use Held-Karp; larger ones nearest neighbor followed by
+    2-opt and Or-opt. Returns (tour, length) with tour[0] == tour[-1] == start.
+    """
+    n = len(matrix)
+    if n <= 1:
+        return [start] * 2 if n else [], 0.0
+    if n <= exact_limit:
+        tour = held_karp(matrix, start)
+    else:
+        tour = nearest_neighbor_tour(matrix, start)
+        neighbors = neighbor_lists(matrix)
+        while True:
+            two_opt(tour, matrix, neighbors)
+            if not or_opt(tour, matrix, neighbors):
+                break
+        i = tour.index(start)
+        tour = tour[i:] + tour[:i]
+    tour.append(start)
+    return tour, tour_length(tour, matrix)
+
+def tour_length(route, matrix):
+    return sum(matrix[a][b] for a, b in zip(route, route[1:]))
+
+def held_karp(matrix, start=0):
+    # best[(subset, last)] over the cities other than start, subset as a bitmask
+    others = [i for i in range(len(matrix)) if i != start]
+    best = {}
+    for k, city in enumerate(others):
+        best[(1 << k, k)] = (matrix[start][city], None)
+    for subset in range(1, 1 << len(others)):
+        for k in range(len(others)):
+            if not subset & (1 << k) or subset == 1 << k:
+                continue
+            prev_subset = subset & ~(1 << k)
+            best[(subset, k)] = min(
+                (best[(prev_subset, j)][0] + matrix[others[j]][others[k]], j)
+                for j in range(len(others)) if prev_subset & (1 << j)
+            )
+
+    full = (1 << len(others)) - 1
+    _, last = min((best[(full, k)][0] + matrix[others[k]][start], k) for k in range(len(others)))
+    tour = []
+    subset = full
+    while last is not None:
+        tour.append(others[last])
+        subset, last = subset & ~(1 << last), best[(subset, last)][1]
+    tour.append(start)
+    tour.reverse()
+    return tour
+
+def nearest_neighbor_tour(matrix, start=0):
+    if isinstance(matrix, PointDistances):
+        # O(n log n): each step is a k-d tree query over the cities not yet visited
+        tree = matrix.spatial_index()
+        tree.remove(start)
+        tour = [start]
+        while len(tree):
+            _, nearest = tree.nearest(tree.points[tour[-1]])[0]
+            tree.remove(nearest)
+            tour.append(nearest)
+        return tour
+
+    unvisited = set(range(len(matrix))) - {start}
+    tour = [start]
+    while unvisited:
+        row = matrix[tour[-1]]
+        nearest = min(unvisited, key=row.__getitem__)
+        tour.append(nearest)
+        unvisited.remove(nearest)
+    return tour
+
+def neighbor_lists(matrix, size=NEIGHBOR_LIST_SIZE):
+    if isinstance(matrix, PointDistances):
+        tree = matrix.spatial_index()
+        return [[j for _, j in tree.nearest(point, size + 1) if j != i][:size]
+                for i, point in enumerate(tree.points)]
+    return [
+        sorted((j for j in range(len(row)) if j != i), key=row.__getitem__)[:size]
+        for i, row in enumerate(matrix)
+    ]
+
+def _reverse(tour, pos, i, j):
+    # Reverse tour[i..j] going forward around the cycle; flipping the shorter
+    # side gives the same cycle, so never touch more than half the tour.
+    n = len(tour)
+    length = (j - i) % n + 1
+    if 2 * length > n:
+        i, j = (j + 1) % n, (i - 1) % n
+        length = n - length
+    for _ in range(length // 2):
+        tour[i], tour[j] = tour[j], tour[i]
+        pos[tour[i]], pos[tour[j]] = i, j
+        i, j = (i + 1) % n, (j - 1) % n
+
+def two_opt(tour, matrix, neighbors):
+    """In-place 2-opt over neighbor lists with don't-look bits."""
+    n = len(tour)
+    if n < 4:
+        return False
+    pos = [0] * n
+    for i, city in enumerate(tour):
+        pos[city] = i
+    dont_look = [False] * n
+    queue = list(tour)
+    improved = False
+
+    while queue:
+        a = queue.pop()
+        if dont_look[a]:
+            continue
+        dont_look[a] = True
+        for forward in (True, False):
+            i = pos[a]
+            b = tour[(i + 1) % n] if forward else tour[i - 1]
+            d_ab = matrix[a][b]
+            for c in neighbors[a]:
+                d_ac = matrix[a][c]
+                if d_ac >= d_ab:
+                    break
+                j = pos[c]
+                d = tour[(j + 1) % n] if forward else tour[j - 1]
+                if c == b or d == a:
+                    continue
+                if d_ac + matrix[b][d] - d_ab - matrix[c][d] < -1e-9:
+                    if forward:
+                        _reverse(tour, pos, (i + 1) % n, j)
+                    else:
+                        _reverse(tour, pos, i, (j - 1) % n)
+                    for city in (a, b, c, d):
+                        dont_look[city] = False
+                        queue.append(city)
+                    improved = True
+                    break
+            else:
+                continue
+            break
+    return improved
+
+def or_opt(tour, matrix, neighbors, max_segment=3):
+    """In-place Or-opt: move runs of 1-3 stops next to a near neighbor.
+
+    Returns the total length saved (0.0 if no move improved the tour).
+    """
+    n = len(tour)
+    saved = 0.0
+    moved = True
+    pos = [0] * n
+    while moved:
+        moved = False
+        for length in range(1, max_segment + 1):
+            if n < length + 3:
+                break
+            for k, city in enumerate(tour):
+                pos[city] = k
+            for i in range(n):
+                segment = [tour[(i + k) % n] for k in range(length)]
+                first, last = segment[0], segment[-1]
+                prev, nxt = tour[i - 1], tour[(i + length) % n]
+                gain = matrix[prev][first] + matrix[last][nxt] - matrix[prev][nxt]
+
+                best = None
+                for end in (first, last):
+                    for c in neighbors[end]:
+                        # Neighbors are nearest first; one no closer than the gain cannot pay for the move
+                        if matrix[end][c] >= gain:
+                            break
+                        k = pos[c]
+                        for left, right in ((tour[k - 1], c), (c, tour[(k + 1) % n])):
+                            # Edges touching the segment disappear with it
+                            if left in segment or right in segment:
+                                continue
+                            # Insert between left and right (that edge is dropped), reversed if shorter
+                            base = gain + matrix[left][right]
+                            for seg in (segment, segment[::-1]):
+                                delta = base - matrix[left][seg[0]] - matrix[seg[-1]][right]
+                                if delta > 1e-9 and (best is None or delta > best[0]):
+                                    best = (delta, right, seg)
+                if best:
+                    delta, right, seg = best
+                    # Rotate the segment to the front, drop it and splice it in before `right`
+                    rest = (tour[i:] + tour[:i])[length:]
+                    at = rest.index(right)
+                    tour[:] = rest[:at] + seg + rest[at:] if at else rest + seg
+                    for k, city in enumerate(tour):
+                        pos[city] = k
+                    moved = True
+                    saved += delta
+    return saved
+
+# Fleet Routing
+# Per-process distance service, set once per worker by _init_fleet_worker
+_fleet_distances = None
+
+def _init_fleet_worker(coordinates, metric):
+    global _fleet_distances
+    _fleet_distances = DistanceService(coordinates, metric)
+
+def _route_cities(cities):
+    tour, length = solve_tsp(_fleet_distances.rows(cities))
+    return [cities[i] for i in tour], length
+
+def route_fleet(truck_cities, coordinates, metric="haversine", max_workers=None):
+    """Route every truck, sharded across a process pool.
+
+    `truck_cities` holds one city list per truck, depot first. Coordinates
+    go to each worker once (pool initializer), not with every truck, and
+    trucks are sent in chunks. Returns [(route, length)] in truck order.
+    """
+    needed = {city for cities in truck_cities for city in cities}
+    coordinates = {city: coordinates[city] for city in needed}
+    workers = min(max_workers or os.cpu_count() or 1, len(truck_cities))
+    if workers <= 1:
+        _init_fleet_worker(coordinates, metric)
+        return [_route_cities(cities) for cities in truck_cities]
+
+    chunksize = max(1, len(truck_cities) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=_init_fleet_worker, initargs=(coordinates, metric)) as pool:
+        return list(pool.map(_route_cities, truck_cities, chunksize=chunksize))
+
+def compare_dispatch(weights, distances, angles, location_ids, locations, capacity, coordinates, depot,
+                     strategies=("knapsack", "cluster"), metric="haversine", max_workers=None):
+    """Trucks and total route km per strategy: allocate-then-route against cluster-first.
+
+    Items are given as columns; `locations` maps location ids to city
+    names. Every truck is routed with route_fleet.
+    """
+    results = {}
+    for strategy in strategies:
+        bins = allocate_bins(weights, distances, capacity, strategy, angles=angles)
+        truck_cities = [[depot] + sorted({locations[location_ids[i]] for i in b} - {depot}) for b in bins]
+        routes = route_fleet(truck_cities, coordinates, metric, max_workers) if bins else []
+        results[strategy] = {"trucks": len(bins), "fleet_km": sum(length for _, length in routes)}
+    return results
+
+# Knapsack Engine
+@timed("knapsack_select")
+def knapsack_select(weights, capacity, exact_limit=KNAPSACK_EXACT_LIMIT):
+    """Pick the indices of the items that fill `capacity` as fully as possible.
+
+    Exact DP keeps a single rolling row plus one bit per (item, capacity) for
+    reconstruction. Above `exact_limit` DP cells it falls back to greedy.
+    Indices are returned in reverse item order, like the original table walk.
+    """
+    if len(weights) * (capacity + 1) > exact_limit:
+        return knapsack_greedy(weights, capacity)
+    if np is not None:
+        return _knapsack_numpy(weights, capacity)
+    return _knapsack_bitset(weights, capacity)
+
+def knapsack_greedy(weights, capacity):
+    """Approximate fill: heaviest items first, taking whatever still fits."""
+    chosen = []
+    for i in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        if 0 < weights[i] <= capacity:
+            chosen.append(i)
+            capacity -= weights[i]
+    chosen.sort(reverse=True)
+    return chosen
+
+def _knapsack_numpy(weights, capacity):
+    # best[c] is the heaviest load <= c; take[i] is bit-packed over c
+    best = np.zeros(capacity + 1, dtype=np.int64)
+    take = np.zeros((len(weights), (capacity + 8) // 8), dtype=np.uint8)
+    row = np.zeros(capacity + 1, dtype=bool)
+    for i, w in enumerate(weights):
+        if w <= 0 or w > capacity:
+            continue
+        candidate = best[:-w] + w
+        improved = candidate > best[w:]
+        best[w:] = np.where(improved, candidate, best[w:])
+        row[:w] = False
+        row[w:] = improved
+        take[i] = np.packbits(row)
+
+    chosen = []
+    c = capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if (take[i, c >> 3] >> (7 - (c & 7))) & 1:
+            chosen.append(i)
+            c -= weights[i]
+    return chosen
+
+def _knapsack_bitset(weights, capacity):
+    # Weight is also the value, so the DP row is a subset-sum bitset held in
+    # one Python int; rows[i] is the reachable set before item i.
+    mask = (1 << (capacity + 1)) - 1
+    reach = 1
+    rows = []
+    for w in weights:
+        rows.append(reach)
+        if 0 < w <= capacity:
+            reach = (reach | (reach << w)) & mask
+
+    chosen = []
+    c = reach.bit_length() - 1
+    for i in range(len(weights) - 1, -1, -1):
+        if c and not (rows[i] >> c) & 1:
+            chosen.append(i)
+            c -= weights[i]
+    return chosen
+
+# Bin Packing
+def pack_first_fit_decreasing(weights, capacity):
+    """Heaviest first, each item into the lowest-numbered bin it fits in.
+
+    A max segment tree over bin spare capacity finds that bin in O(log n).
+    Returns a list of bins, each a list of item indices.
+    """
+    _check_fits(weights, capacity)
+    size = 1
+    while size < len(weights):
+        size *= 2
+    # Every leaf starts as an empty (not yet opened) bin
+    spare = [capacity] * (2 * size)
+    bins = []
+    for i in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        w = weights[i]
+        node = 1
+        while node < size:
+            node = 2 * node if spare[2 * node] >= w else 2 * node + 1
+        slot = node - size
+        if slot == len(bins):
+            bins.append([])
+        bins[slot].append(i)
+
+        spare[node] -= w
+        node //= 2
+        while node:
+            spare[node] = max(spare[2 * node], spare[2 * node + 1])
+            node //= 2
+    return bins
+
+def pack_best_fit_decreasing(weights, capacity):
+    """Heaviest first, each item into the open bin with the least spare room it fits in.
+
+    Bins are bucketed by the heaviest item weight their spare room still
+    takes, each bucket a heap by spare room; a count tree over the buckets
+    finds the first non-empty one at or above an item's weight, so each
+    item costs O(log n). Bins too full for the lightest item are dropped.
+    """
+    _check_fits(weights, capacity)
+    sizes = sorted(set(weights))
+    size = 2  # at least two leaves, so the root is never a leaf
+    while size < len(sizes):
+        size *= 2
+    counts = [0] * (2 * size)  # open bins per bucket, summed up the tree
+    buckets = [[] for _ in sizes]  # heaps of (spare, bin index)
+    bins = []
+
+    def count(k, delta):
+        node = k + size
+        while node:
+            counts[node] += delta
+            node //= 2
+
+    def place(b, spare):
+        k = bisect_right(sizes, spare) - 1
+        if k >= 0:
+            heapq.heappush(buckets[k], (spare, b))
+            count(k, 1)
+
+    for i in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        w = weights[i]
+        # Leftmost non-empty bucket at or after w's
+        node = bisect_left(sizes, w) + size
+        if not counts[node]:
+            while node > 1 and not (node % 2 == 0 and counts[node + 1]):
+                node //= 2
+            if node > 1:
+                node += 1
+                while node < size:
+                    node = 2 * node if counts[2 * node] else 2 * node + 1
+        if node >= size and counts[node]:
+            k = node - size
+            spare, b = heapq.heappop(buckets[k])
+            count(k, -1)
+            bins[b].append(i)
+            place(b, spare - w)
+        else:
+            bins.append([i])
+            place(len(bins) - 1, capacity - w)
+    return bins
+
+def location_angles(cities, coordinates, depot):
+    """Bearing of each city around the depot, in [0, 2*pi), starting after the widest empty sector.
+
+    Starting the sweep in the widest gap keeps a cluster of cities from
+    being split between the first and the last truck. Cities without
+    coordinates get 0.0.
+    """
+    lat0, lon0 = coordinates[depot]
+    scale = math.cos(math.radians(lat0))
+    raw = []
+    for city in cities:
+        if city in coordinates and city != depot:
+            lat, lon = coordinates[city]
+            raw.append(math.atan2(lat - lat0, (lon - lon0) * scale) % math.tau)
+        else:
+            raw.append(None)
+    known = sorted({a for a in raw if a is not None})
+    start = 0.0
+    if len(known) > 1:
+        gaps = [(known[0] + math.tau - known[-1], known[0])]
+        gaps += [(b - a, b) for a, b in zip(known, known[1:])]
+        start = max(gaps)[1]
+    return [0.0 if a is None else (a - start) % math.tau for a in raw]
+
+def pack_sweep(weights, angles, capacity, lookahead=SWEEP_LOOKAHEAD):
+    """Cluster-first packing: fill trucks in order of bearing from the depot.
+
+    Items are taken by angle (heaviest first within a city); an item that
+    does not fit is set aside while up to `lookahead` later ones are tried,
+    then goes first into the next truck. O(n log n + n * lookahead).
+    """
+    _check_fits(weights, capacity)
+    pending = deque(sorted(range(len(weights)), key=lambda i: (angles[i], -weights[i])))
+    bins = []
+    while pending:
+        load = 0
+        current = []
+        skipped = []
+        while pending and len(skipped) < lookahead and load < capacity:
+            i = pending.popleft()
+            if load + weights[i] <= capacity:
+                current.append(i)
+                load += weights[i]
+            else:
+                skipped.append(i)
+        pending.extendleft(reversed(skipped))
+        bins.append(current)
+    return bins
+
+def improve_packing(bins, weights, capacity, max_passes=100):
+    """Local search: keep emptying the lightest bin into the others' spare room."""
+    bins = [list(b) for b in bins]
+    loads = [sum(weights[i] for i in b) for b in bins]
+    for _ in range(max_passes):
+        if len(bins) < 2:
+            break
+        lightest = min(range(len(bins)), key=loads.__getitem__)
+        trial = loads[:]
+        moves = []
+        for i in sorted(bins[lightest], key=lambda i: weights[i], reverse=True):
+            targets = [b for b in range(len(bins)) if b != lightest and trial[b] + weights[i] <= capacity]
+            if not targets:
+                break
+            b = max(targets, key=trial.__getitem__)
+            trial[b] += weights[i]
+            moves.append((i, b))
+        else:
+            for i, b in moves:
+                bins[b].append(i)
+            del bins[lightest]
+            del trial[lightest]
+            loads = trial
+            continue
+        break
+    return bins
+
+def compare_strategies(weights, distances, capacity, angles=None):
+    """Truck count and utilization of every strategy, computed from the columns.
+
+    "cluster" is included when the items' sweep `angles` are given.
+    """
+    total = sum(weights)
+    results = {}
+    for strategy in ALLOCATION_STRATEGIES:
+        if strategy == "cluster" and angles is None:
+            continue
+        for improve in ((False, True) if strategy in ("ffd", "bfd") else (False,)):
+            bins = allocate_bins(weights, distances, capacity, strategy, improve, angles)
+            results[strategy + ("+ls" if improve else "")] = {
+                "trucks": len(bins),
+                "utilization": total / (len(bins) * capacity) if bins else 0.0,
+            }
+    return results
+
+def _check_fits(weights, capacity):
+    too_heavy = [w for w in weights if w > capacity]
+    if too_heavy:
+        raise ValueError(f"Package weight {max(too_heavy)} exceeds truck capacity {capacity}")
+
+@timed("allocate_bins")
+def allocate_bins(weights, distances, capacity, strategy="knapsack", improve=False, angles=None):
+    """Allocate item indices to trucks straight from weight/distance columns.
+
+    Each truck is ordered by distance (furthest first) and trucks by their
+    furthest destination, as TruckManager.allocate_trucks presents them.
+    The "cluster" strategy also needs each item's sweep angle (see
+    location_angles); `improve` only applies to "ffd" and "bfd".
+    """
+    if strategy == "knapsack":
+        bins = []
+        remaining = list(range(len(weights)))
+        while remaining:
+            chosen = knapsack_select([weights[i] for i in remaining], capacity)
+            if not chosen:
+                _check_fits([weights[i] for i in remaining], capacity)
+                chosen = list(range(len(remaining)))  # only zero-weight items are left
+            chosen_set = set(chosen)
+            bins.append([remaining[k] for k in chosen])
+            remaining = [i for k, i in enumerate(remaining) if k not in chosen_set]
+    elif strategy in ("ffd", "bfd"):
+        pack = pack_first_fit_decreasing if strategy == "ffd" else pack_best_fit_decreasing
+        bins = pack(weights, capacity)
+        if improve:
+            bins = improve_packing(bins, weights, capacity)
+    elif strategy == "cluster":
+        if angles is None:
+            raise ValueError("The cluster strategy needs package locations")
+        bins = pack_sweep(weights, angles, capacity)
+    else:
+        raise ValueError(f"Unknown allocation strategy: {strategy}")
+
+    for b in bins:
+        b.sort(key=distances.__getitem__, reverse=True)
+    # Sort trucks by the furthest destination (max distance in each truck)
+    bins.sort(key=lambda b: distances[b[0]], reverse=True)
+    return bins
+
+def is_paid(payment_status):
+    """Invoiceable: paid up front or collected on delivery."""
+    return payment_status in ("Paid", "Pay later (COD)")
+
+# Package Codes
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+FEISTEL_ROUNDS = 4
+# claim() only advances the counter this far; codes beyond it were not issued here
+CODE_CLAIM_WINDOW = 1 << 16
+
+
+class CodeAllocator:
+    """Unique package codes in O(1), without remembering them as strings.
+
+    Code i is counter value i sent through a keyed Feistel network and
+    cycle-walked back into the CODE_ALPHABET**length space: a permutation,
+    so codes never repeat yet do not look sequential. Codes in use are one
+    bit each in `issued`, indexed by counter value.
+    """
+
+    def __init__(self, key=None, counter=0, issued=b"", length=CODE_LENGTH):
+        self.key = random.getrandbits(64) if key is None else key
+        self.length = length
+        self.space = len(CODE_ALPHABET) ** length
+        self.half_bits = ((self.space - 1).bit_length() + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys = [(self.key >> (16 * r)) & 0xFFFF for r in range(FEISTEL_ROUNDS)]
+        self.counter = counter
+        self.issued = bytearray(issued)
+        self.digits = {c: i for i, c in enumerate(CODE_ALPHABET)}
+
+    def __contains__(self, code):
+        i = self.index(code)
+        return i is not None and i < self.counter and bool(self.issued[i >> 3] & (1 << (i & 7)))
+
+    def next(self):
+        if self.counter >= self.space:
+            raise RuntimeError("Package code space exhausted")
+        i = self.counter
+        self.counter += 1
+        self._mark(i)
+        return self.encode(self.permute(i))
+
+    def claim(self, code):
+        """Mark a code issued before (e.g. replayed from the journal) as in use.
+
+        Returns False for codes this allocator cannot have issued: outside
+        its space, or further past the counter than CODE_CLAIM_WINDOW (a
+        code from another key or brought by a manifest).
+        """
+        i = self.index(code)
+        if i is None or i >= self.counter + CODE_CLAIM_WINDOW:
+            return False
+        self.counter = max(self.counter, i + 1)
+        self._mark(i)
+        return True
+
+    def release(self, code):
+        i = self.index(code)
+        if i is not None and i < self.counter:
+            self.issued[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def index(self, code):
+        """Counter value that produced `code`, or None if no counter can."""
+        if not isinstance(code, str) or len(code) != self.length:
+            return None
+        value = 0
+        for c in code:
+            digit = self.digits.get(c)
+            if digit is None:
+                return None
+            value = value * len(CODE_ALPHABET) + digit
+        return self.unpermute(value)
+
+    def encode(self, value):
+        chars = []
+        for _ in range(self.length):
+            value, digit = divmod(value, len(CODE_ALPHABET))
+            chars.append(CODE_ALPHABET[digit])
+        return "".join(reversed(chars))
+
+    def permute(self, value):
+        value = self._feistel(value)
+        while value >= self.space:  # cycle-walk; ~2 rounds expected for 36**6
+            value = self._feistel(value)
+        return value
+
+    def unpermute(self, value):
+        value = self._feistel_inverse(value)
+        while value >= self.space:
+            value = self._feistel_inverse(value)
+        return value
+
+    def _round(self, half, key):
+        x = ((half ^ key) * 0x9E3779B1) & 0xFFFFFFFF
+        return (x ^ (x >> 15)) & self.half_mask
+
+    def _feistel(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in self.round_keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def _feistel_inverse(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for key in reversed(self.round_keys):
+            left, right = right ^ self._round(left, key), left
+        return (left << self.half_bits) | right
+
+    def _mark(self, i):
+        byte = i >> 3
+        if byte >= len(self.issued):
+            self.issued.extend(bytes(byte + 1 - len(self.issued)))
+        self.issued[byte] |= 1 << (i & 7)
+
+
+# Packages and Allocation
+class Package:
+    __slots__ = ("package_code", "location", "weight", "distance", "shipping_type", "payment_status")
+
+    def __init__(self, package_code, location, weight, distance, shipping_type, payment_status="Unpaid"):
+        self.package_code = package_code
+        self.location = location
+        self.weight = weight
+        self.distance = distance
+        self.shipping_type = shipping_type
+        self.payment_status = payment_status
+
+
+class Interner:
+    """Small integer ids for repeated strings (cities, shipping types, statuses)."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.ids = {}
+        for value in values:
+            self.id(value)
+
+    def id(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+class PackageRef:
+    """A package row inside a PackageStore, read and written through its columns."""
+
+    __slots__ = ("store", "package_code")
+
+    def __init__(self, store, package_code):
+        self.store = store
+        self.package_code = package_code
+
+    def _row(self):
+        return self.store.row_of[self.package_code]
+
+    @property
+    def location(self):
+        return self.store.locations.values[self.store.location_ids[self._row()]]
+
+    @property
+    def weight(self):
+        return self.store.weights[self._row()]
+
+    @property
+    def distance(self):
+        return self.store.distances[self._row()]
+
+    @property
+    def shipping_type(self):
+        return self.store.shipping_types.values[self.store.shipping_ids[self._row()]]
+
+    @property
+    def payment_status(self):
+        return self.store.statuses.values[self.store.status_ids[self._row()]]
+
+    @payment_status.setter
+    def payment_status(self, value):
+        self.store.set_status(self.package_code, value)
+
+    def detach(self):
+        return Package(self.package_code, self.location, self.weight, self.distance,
+                       self.shipping_type, self.payment_status)
+
+    def __eq__(self, other):
+        return isinstance(other, PackageRef) and other.store is self.store and other.package_code == self.package_code
+
+    def __hash__(self):
+        return hash(self.package_code)
+
+
+class PackageStore:
+    """Columnar package storage with O(1) lookup by package_code.
+
+    Weights and distances live in array('l') columns; location, shipping type
+    and payment status are interned ids. Removal leaves a tombstone and rows
+    are compacted lazily, so position i is only meaningful after compact().
+    Iterating or indexing yields PackageRef views, so callers keep the
+    Package attribute API.
+    """
+
+    COLUMNS = ("weights", "distances", "location_ids", "shipping_ids", "status_ids")
+
+    def __init__(self, packages=()):
+        self.codes = []
+        self.weights = array("l")
+        self.distances = array("l")
+        self.location_ids = array("L")
+        self.shipping_ids = array("B")
+        self.status_ids = array("B")
+        self.alive = bytearray()
+        self.row_of = {}
+        self.locations = Interner()
+        self.shipping_types = Interner()
+        self.statuses = Interner()
+        # Secondary indexes: interned id -> set of package codes
+        self.by_location = {}
+        self.by_status = {}
+        # Bumped whenever packages are added or removed
+        self.version = 0
+        self.extend(packages)
+
+    @classmethod
+    def from_columns(cls, codes, columns, locations, shipping_types, statuses):
+        """Rebuild a store from saved columns (see Persistence) without per-row appends."""
+        store = cls()
+        store.codes = list(codes)
+        for name, column in columns.items():
+            setattr(store, name, column)
+        store.alive = bytearray(b"\x01") * len(store.codes)
+        store.row_of = {code: row for row, code in enumerate(store.codes)}
+        store.locations = Interner(locations)
+        store.shipping_types = Interner(shipping_types)
+        store.statuses = Interner(statuses)
+        for index, ids in ((store.by_location, store.location_ids), (store.by_status, store.status_ids)):
+            for code, i in zip(store.codes, ids):
+                index.setdefault(i, set()).add(code)
+        store.version = len(store.codes)
+        return store
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, package_code):
+        return package_code in self.row_of
+
+    def __iter__(self):
+        for row, code in enumerate(self.codes):
+            if self.alive[row]:
+                yield PackageRef(self, code)
+
+    def __getitem__(self, index):
+        if len(self.codes) != len(self.row_of):
+            self.compact()
+        return PackageRef(self, self.codes[index])
+
+    def append(self, package):
+        if package.package_code in self.row_of:
+            raise ValueError(f"Duplicate package code {package.package_code}")
+        code = package.package_code
+        location_id = self.locations.id(package.location)
+        status_id = self.statuses.id(package.payment_status)
+        self.row_of[code] = len(self.codes)
+        self.codes.append(code)
+        self.weights.append(package.weight)
+        self.distances.append(package.distance)
+        self.location_ids.append(location_id)
+        self.shipping_ids.append(self.shipping_types.id(package.shipping_type))
+        self.status_ids.append(status_id)
+        self.alive.append(1)
+        self.by_location.setdefault(location_id, set()).add(code)
+        self.by_status.setdefault(status_id, set()).add(code)
+        self.version += 1
+        return PackageRef(self, package.package_code)
+
+    def extend(self, packages):
+        for package in packages:
+            self.append(package)
+
+    def get(self, package_code):
+        if package_code not in self.row_of:
+            raise KeyError(package_code)
+        return PackageRef(self, package_code)
+
+    def remove(self, package_code):
+        """Drop a package and return it as a detached Package."""
+        package = self.get(package_code).detach()
+        row = self.row_of.pop(package_code)
+        self.alive[row] = 0
+        self.by_location[self.location_ids[row]].discard(package_code)
+        self.by_status[self.status_ids[row]].discard(package_code)
+        self.version += 1
+        if len(self.codes) > 2 * len(self.row_of) + 64:
+            self.compact()
+        return package
+
+    def set_status(self, package_code, payment_status):
+        row = self.row_of[package_code]
+        status_id = self.statuses.id(payment_status)
+        self.by_status[self.status_ids[row]].discard(package_code)
+        self.by_status.setdefault(status_id, set()).add(package_code)
+        self.status_ids[row] = status_id
+
+    def with_location(self, location):
+        location_id = self.locations.ids.get(location)
+        return [PackageRef(self, code) for code in self.by_location.get(location_id, ())]
+
+    def with_status(self, payment_status):
+        status_id = self.statuses.ids.get(payment_status)
+        return [PackageRef(self, code) for code in self.by_status.get(status_id, ())]
+
+    def compact(self):
+        if len(self.codes) == len(self.row_of):
+            return
+        keep = [row for row, alive in enumerate(self.alive) if alive]
+        self.codes = [self.codes[row] for row in keep]
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[row] for row in keep)))
+        self.alive = bytearray(b"\x01") * len(keep)
+        self.row_of = {code: row for row, code in enumerate(self.codes)}
+
+
+class IncrementalAllocator:
+    """Keep per-truck state so add/cancel only touch the trucks involved.
+
+    `full_allocate` is the full repack (e.g. TruckApp.allocate_trucks) used by
+    `rebalance()`. `max_gap` is how many trucks above the lower bound
+    ceil(total_weight / max_weight) we tolerate before rebalancing on our own;
+    0 keeps results as tight as a full repack, None never rebalances.
+    If `on_drift` is set it is called instead of rebalancing inline, so a UI
+    can run the repack elsewhere.
+    """
+
+    def __init__(self, max_weight, full_allocate, max_gap=1, on_drift=None):
+        self.max_weight = max_weight
+        self.full_allocate = full_allocate
+        self.max_gap = max_gap
+        self.on_drift = on_drift
+        self.trucks = []
+        self.loads = []
+        self.truck_of = {}  # package_code -> truck index
+        # Per-truck indexes, kept parallel to self.trucks
+        self.cities = []  # {city: package count}
+        self.unpaid = []  # codes neither Paid nor Pay later (COD)
+
+    def load(self, trucks):
+        # Adopt an allocation produced elsewhere (e.g. the full repack)
+        self.trucks = trucks
+        self.loads = [sum(p.weight for p in truck) for truck in trucks]
+        self.truck_of = {p.package_code: i for i, truck in enumerate(trucks) for p in truck}
+        self.cities = []
+        self.unpaid = []
+        for truck in trucks:
+            cities = {}
+            for p in truck:
+                cities[p.location] = cities.get(p.location, 0) + 1
+            self.cities.append(cities)
+            self.unpaid.append({p.package_code for p in truck if not is_paid(p.payment_status)})
+        return self.trucks
+
+    def rebalance(self, packages):
+        """Full repack of every package; use when per-truck drift matters."""
+        return self.load(self.full_allocate(packages))
+
+    def add(self, package):
+        # Best fit: the truck whose spare capacity is the smallest that still fits
+        best = None
+        for i, load in enumerate(self.loads):
+            spare = self.max_weight - load
+            if spare >= package.weight and (best is None or spare < self.max_weight - self.loads[best]):
+                best = i
+
+        if best is None:
+            self.trucks.append([])
+            self.loads.append(0)
+            self.cities.append({})
+            self.unpaid.append(set())
+            best = len(self.trucks) - 1
+
+        truck = self.trucks[best]
+        truck.append(package)
+        truck.sort(key=lambda p: p.distance, reverse=True)
+        self.loads[best] += package.weight
+        self.truck_of[package.package_code] = best
+        self.cities[best][package.location] = self.cities[best].get(package.location, 0) + 1
+        if not is_paid(package.payment_status):
+            self.unpaid[best].add(package.package_code)
+        self._resort(best)
+        if len(truck) == 1:
+            self._check_gap()
+        return self.trucks
+
+    def cancel(self, package):
+        index = self.truck_of.pop(package.package_code, None)
+        if index is None:
+            return self.trucks
+
+        truck = self.trucks[index]
+        truck[:] = [p for p in truck if p.package_code != package.package_code]
+        self.loads[index] -= package.weight
+        cities = self.cities[index]
+        cities[package.location] -= 1
+        if not cities[package.location]:
+            del cities[package.location]
+        self.unpaid[index].discard(package.package_code)
+
+        if not truck:
+            for per_truck in (self.trucks, self.loads, self.cities, self.unpaid):
+                del per_truck[index]
+            for i in range(index, len(self.trucks)):
+                for p in self.trucks[i]:
+                    self.truck_of[p.package_code] = i
+        else:
+            self._resort(index)
+        self._check_gap()
+        return self.trucks
+
+    def _resort(self, index):
+        # Trucks are kept ordered by their furthest destination (like allocate_trucks);
+        # only the changed truck can be out of place, so bubble it into position.
+        key = lambda i: self.trucks[i][0].distance
+        while index > 0 and key(index - 1) < key(index):
+            self._swap(index - 1, index)
+            index -= 1
+        while index < len(self.trucks) - 1 and key(index + 1) > key(index):
+            self._swap(index, index + 1)
+            index += 1
+
+    def _swap(self, i, j):
+        for per_truck in (self.trucks, self.loads, self.cities, self.unpaid):
+            per_truck[i], per_truck[j] = per_truck[j], per_truck[i]
+        for p in self.trucks[i]:
+            self.truck_of[p.package_code] = i
+        for p in self.trucks[j]:
+            self.truck_of[p.package_code] = j
+
+    def update_status(self, package):
+        # Keep the truck's unpaid index in step with a payment confirmation
+        index = self.truck_of.get(package.package_code)
+        if index is None:
+            return
+        if is_paid(package.payment_status):
+            self.unpaid[index].discard(package.package_code)
+        else:
+            self.unpaid[index].add(package.package_code)
+
+    def _check_gap(self):
+        if self.max_gap is None or not self.trucks:
+            return
+        lower_bound = math.ceil(sum(self.loads) / self.max_weight)
+        if len(self.trucks) > lower_bound + self.max_gap:
+            if self.on_drift is not None:
+                self.on_drift()
+            else:
+                self.rebalance([p for truck in self.trucks for p in truck])
+
+
+# City Registry
+# Road km per great-circle km, for cities listed without a road distance
+ROAD_DETOUR_FACTOR = 1.25
+
+
+class CityRegistry:
+    """Depot and destinations with their (lat, lon) and road distance from the depot.
+
+    Road distances come from the file where known, otherwise from the
+    coordinates (great-circle km x ROAD_DETOUR_FACTOR), computed once per
+    city. nearest() answers from a k-d tree over all cities.
+    """
+
+    def __init__(self, depot, cities=()):
+        self.depot = depot
+        self.coordinates = {}
+        self.road_km = {}
+        self.names = []
+        self.index = None
+        for name, lat, lon, *distance in cities:
+            self.add(name, lat, lon, distance[0] if distance else None)
+
+    @classmethod
+    def from_file(cls, path, depot=None):
+        """Cities from a .json list or a CSV with city, lat, lon and optional distance columns.
+
+        The depot is `depot`, else the city marked depot=1/true, else the first one.
+        """
+        if path.endswith(".json"):
+            with open(path) as f:
+                rows = json.load(f)
+        else:
+            with open(path, newline="") as f:
+                rows = list(csv.DictReader(f))
+        if not rows:
+            raise ValueError(f"No cities in {path}")
+
+        cities = []
+        for line_no, row in enumerate(rows, 1):
+            try:
+                name = row.get("city") or row["name"]
+                distance = row.get("distance")
+                cities.append((name, float(row["lat"]), float(row["lon"]),
+                               None if distance in (None, "") else int(float(distance))))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Invalid city on row {line_no}: {row}")
+            if depot is None and str(row.get("depot", "")).lower() in ("1", "true", "yes"):
+                depot = name
+        return cls(depot or cities[0][0], cities)
+
+    def __contains__(self, name):
+        return name in self.coordinates
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, lat, lon, distance=None):
+        if name not in self.coordinates:
+            self.names.append(name)
+        self.coordinates[name] = (lat, lon)
+        if distance is not None:
+            self.road_km[name] = distance
+        else:
+            self.road_km.pop(name, None)
+        self.index = None
+
+    def destinations(self):
+        return [name for name in self.names if name != self.depot]
+
+    def is_destination(self, name):
+        return name != self.depot and name in self.coordinates
+
+    def distance_from_depot(self, name):
+        """Road km from the depot; derived from coordinates (and cached) if not given."""
+        distance = self.road_km.get(name)
+        if distance is None:
+            distance = self.road_km[name] = round(
+                haversine_distance(self.coordinates[self.depot], self.coordinates[name]) * ROAD_DETOUR_FACTOR)
+        return distance
+
+    def nearest(self, target, k=1):
+        """The k cities closest to a city name or (lat, lon), nearest first."""
+        if self.index is None:
+            self.index = KDTree([spatial_key(self.coordinates[name]) for name in self.names])
+        point = self.coordinates[target] if isinstance(target, str) else target
+        found = self.index.nearest(spatial_key(point), k + 1)
+        return [self.names[i] for _, i in found if self.names[i] != target][:k]
+
+
+# Default depot and destinations: (city, lat, lon, road km from Hanoi)
+DEFAULT_CITIES = CityRegistry("Hanoi", [
+    ("Hanoi", 21.0285, 105.8542, 0),
+    ("HCMC", 10.8231, 106.6297, 1750),
+    ("Nha Trang", 12.2388, 109.1967, 1300),
+    ("Da Nang", 16.0471, 108.2068, 767),
+    ("Dalat", 11.9404, 108.4583, 1480),
+    ("Hai Phong", 20.8449, 106.6881, 120),
+])
+SHIPPING_TYPES = ["COD", "Bank Transfer", "Credit Card"]
+
+
+def validate_package(weight, destination, payment_type, cities=DEFAULT_CITIES):
+    """The Add Package rules; raises ValueError with the message shown to users."""
+    if weight < 1 or weight > 10:
+        raise ValueError("Invalid weight")
+    if not cities.is_destination(destination):
+        raise ValueError("Invalid destination")
+    if payment_type not in SHIPPING_TYPES:
+        raise ValueError("Invalid payment type")
+
+
+def payment_status_for(payment_type, payment_status=None):
+    """`payment_status` if the shipping type allows it, else ValueError; the initial status if None.
+
+    COD is always "Pay later (COD)"; other types start "Unpaid" and may be "Paid".
+    """
+    allowed = ("Pay later (COD)",) if payment_type == "COD" else ("Unpaid", "Paid")
+    if payment_status is None:
+        return allowed[0]
+    if payment_status not in allowed:
+        raise ValueError(f"Invalid payment status {payment_status!r} for {payment_type}")
+    return payment_status
+
+
+def package_fields(package):
+    return {
+        "package_code": package.package_code,
+        "location": package.location,
+        "weight": package.weight,
+        "distance": package.distance,
+        "shipping_type": package.shipping_type,
+        "payment_status": package.payment_status,
+    }
+
+
+def journaled(method):
+    """Mark a TruckManager method that changes state and records it in the journal.
+
+    The journal may only checkpoint between operations, once the outermost
+    one has returned; a drift rebalance inside an add/cancel is part of it.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.operation_depth += 1
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            self.operation_depth -= 1
+        if not self.operation_depth and self.journal is not None:
+            self.journal.settle()
+        return result
+    return wrapper
+
+
+# Invoicing
+class Tariff:
+    """Invoice cost per package: weight * distance * rate + base.
+
+    `shipping_types` maps a shipping type to its own (rate, base); other
+    types use the defaults.
+    """
+
+    def __init__(self, rate=0.05, base=100, shipping_types=None):
+        self.rate = rate
+        self.base = base
+        self.shipping_types = dict(shipping_types or {})
+
+    @classmethod
+    def from_dict(cls, table):
+        shipping_types = {name: (terms["rate"], terms["base"])
+                          for name, terms in table.get("shipping_types", {}).items()}
+        return cls(table.get("rate", 0.05), table.get("base", 100), shipping_types)
+
+    def terms(self, shipping_type):
+        return self.shipping_types.get(shipping_type, (self.rate, self.base))
+
+    def cost(self, package):
+        rate, base = self.terms(package.shipping_type)
+        return (package.weight * package.distance * rate) + base
+
+    def costs(self, weights, distances, shipping_ids, shipping_types):
+        """Cost of every row of the columns at once; `shipping_types` maps id -> name."""
+        terms = [self.terms(name) for name in shipping_types]
+        rates = [rate for rate, _ in terms]
+        bases = [base for _, base in terms]
+        if np is not None and len(weights):
+            ids = np.frombuffer(shipping_ids, dtype=np.uint8)
+            return (np.asarray(weights) * np.asarray(distances) * np.array(rates, dtype=np.float64)[ids]
+                    + np.array(bases, dtype=np.float64)[ids])
+        return array("d", (w * d * rates[s] + bases[s] for w, d, s in zip(weights, distances, shipping_ids)))
+
+
+DEFAULT_TARIFF = Tariff()
+
+
+class Invoice:
+    """One truck's bill, copied out of the store so it outlives later changes to it."""
+
+    def __init__(self, truck, codes, locations, costs, total, unpaid=()):
+        self.truck = truck
+        self.codes = codes  # in truck order
+        self.locations = locations  # interned names, shared with the store
+        self.costs = costs
+        self.total = total
+        self.unpaid = list(unpaid)  # codes blocking the invoice; no costs if any
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lines(self):
+        """(package_code, location, cost) per package."""
+        return zip(self.codes, self.locations, self.costs)
+
+
+class TruckManager:
+    """Packages, allocation, routing and invoicing without any UI."""
+
+    def __init__(self, max_weight=25, packages=None, cities=None,
+                 allocation_strategy="knapsack", improve_packing=False, truck_rows=None, tariff=None):
+        self.max_weight = max_weight
+        self.tariff = DEFAULT_TARIFF if tariff is None else tariff
+        self.allocation_strategy = allocation_strategy
+        self.improve_packing = improve_packing
+        self.trucks = []
+        self.codes = CodeAllocator()
+        # Optional event sink (see Persistence.StateStore)
+        self.journal = None
+        self.operation_depth = 0  # nesting of @journaled calls
+
+        # Depot, destinations and their coordinates for routing
+        self.cities = DEFAULT_CITIES if cities is None else cities
+        self.city_coordinates = self.cities.coordinates
+        # city_coordinates are (lat, lon), so route in great-circle km
+        self.distances = DistanceService(self.city_coordinates, metric="haversine")
+
+        if isinstance(packages, PackageStore):
+            self.packages = packages
+        else:
+            self.packages = PackageStore(self.generate_packages() if packages is None else packages)
+        # Drift goes through rebalance_trucks so it is journaled like any other repack
+        self.allocator = IncrementalAllocator(self.max_weight, self.allocate_trucks, on_drift=self.rebalance_trucks)
+        if truck_rows is None:
+            self.trucks = self.allocator.rebalance(self.packages)
+        else:
+            # A saved allocation, as row positions into the (compact) store
+            self.trucks = self.allocator.load([[self.packages[i] for i in rows] for rows in truck_rows])
+
+    def record(self, op, **fields):
+        if self.journal is not None:
+            self.journal.record(op, fields)
+
+    def generate_random_code(self):
+        """Generate a unique 6-character alphanumeric package code."""
+        code = self.codes.next()
+        # Imported manifests may bring their own codes from the same space
+        while code in self.packages:
+            code = self.codes.next()
+        return code
+
+    def code_in_use(self, package_code):
+        """Whether a code is taken, in O(1) and without a set of codes.
+
+        Codes from the allocator are checked in its bitmap, including ones
+        generated for packages not yet stored; codes packages brought
+        themselves are found in the store's index.
+        """
+        return package_code in self.codes or package_code in self.packages
+
+    def generate_packages(self):
+        packages = []
+        destinations = self.cities.destinations()
+        for i in range(6):
+            city = random.choice(destinations)
+            shipping_type = random.choice(SHIPPING_TYPES)
+            payment_status = "Pay later (COD)" if shipping_type == "COD" else "Unpaid"
+            packages.append(Package(
+                package_code=self.codes.next(),
+                location=city,
+                weight=random.randint(1, 10),
+                distance=self.cities.distance_from_depot(city),
+                shipping_type=shipping_type,
+                payment_status=payment_status
+            ))
+        return packages
+
+    @timed("allocate_trucks")
+    def allocate_trucks(self, packages=None, strategy=None, improve=None):
+        # Allocate packages to trucks using the selected strategy
+        packages = self.packages if packages is None else packages
+        strategy = strategy or self.allocation_strategy
+        improve = self.improve_packing if improve is None else improve
+
+        if isinstance(packages, PackageStore):
+            # Work on the columns directly; refs are only built for the result
+            packages.compact()
+            weights, distances = packages.weights, packages.distances
+        else:
+            weights = [p.weight for p in packages]
+            distances = [p.distance for p in packages]
+        angles = self.sweep_angles(packages) if strategy == "cluster" else None
+
+        bins = allocate_bins(weights, distances, self.max_weight, strategy, improve, angles)
+        return [[packages[i] for i in b] for b in bins]
+
+    def sweep_angles(self, packages=None):
+        """Each package's bearing from the depot, for the "cluster" strategy."""
+        packages = self.packages if packages is None else packages
+        if isinstance(packages, PackageStore):
+            packages.compact()
+            by_id = location_angles(packages.locations.values, self.city_coordinates, self.cities.depot)
+            return array("d", (by_id[i] for i in packages.location_ids))
+        cities = sorted({p.location for p in packages})
+        by_city = dict(zip(cities, location_angles(cities, self.city_coordinates, self.cities.depot)))
+        return array("d", (by_city[p.location] for p in packages))
+
+    @timed("rebalance_trucks")
+    @journaled
+    def rebalance_trucks(self):
+        """Full repack of all packages, discarding the incremental allocation."""
+        self.trucks = self.allocator.rebalance(self.packages)
+        self.record("rebalance", strategy=self.allocation_strategy, improve=self.improve_packing)
+        return self.trucks
+
+    def allocation_snapshot(self):
+        """Copies of what allocate_bins needs, so it can run off this thread.
+
+        Returns (version, args); pass the resulting bins and the version to
+        apply_allocation.
+        """
+        self.packages.compact()
+        angles = self.sweep_angles() if self.allocation_strategy == "cluster" else None
+        args = (array("l", self.packages.weights), array("l", self.packages.distances),
+                self.max_weight, self.allocation_strategy, self.improve_packing, angles)
+        return (self.packages.version, self.allocation_strategy, self.improve_packing), args
+
+    @timed("apply_allocation")
+    @journaled
+    def apply_allocation(self, version, bins):
+        """Adopt bins from allocate_bins unless packages or strategy changed since the snapshot."""
+        if version != (self.packages.version, self.allocation_strategy, self.improve_packing):
+            return False
+        self.trucks = self.allocator.load([[self.packages[i] for i in b] for b in bins])
+        self.record("rebalance", strategy=self.allocation_strategy, improve=self.improve_packing)
+        return True
+
+    def compare_allocation_strategies(self):
+        """Truck count and utilization of every strategy over the current packages."""
+        self.packages.compact()
+        return compare_strategies(self.packages.weights, self.packages.distances, self.max_weight,
+                                  self.sweep_angles())
+
+    def dispatch_snapshot(self, strategies=None):
+        """Arguments for compare_dispatch, copied so it can run off this thread.
+
+        The baseline is the current strategy (knapsack while that is
+        "cluster"), compared with cluster-first dispatch.
+        """
+        if strategies is None:
+            baseline = "knapsack" if self.allocation_strategy == "cluster" else self.allocation_strategy
+            strategies = (baseline, "cluster")
+        store = self.packages
+        store.compact()
+        return (array("l", store.weights), array("l", store.distances), self.sweep_angles(),
+                array("L", store.location_ids), list(store.locations.values), self.max_weight,
+                dict(self.city_coordinates), self.cities.depot, tuple(strategies), self.distances.metric)
+
+    @timed("compare_dispatch")
+    def compare_dispatch(self, strategies=None, max_workers=None):
+        """{strategy: {"trucks", "fleet_km"}} for the baseline pipeline and cluster-first dispatch."""
+        return compare_dispatch(*self.dispatch_snapshot(strategies), max_workers)
+
+    def find_package(self, package_code):
+        return self.packages.get(package_code)
+
+    @timed("add_package")
+    def add_package(self, weight, destination, payment_type, distance=None):
+        """Validate and add one package, placing it on a truck with spare capacity."""
+        validate_package(weight, destination, payment_type, self.cities)
+
+        # Set the payment status based on the payment type
+        payment_status = "Pay later (COD)" if payment_type == "COD" else "Unpaid"
+        package = Package(
+            self.generate_random_code(),
+            destination,
+            weight,
+            self.cities.distance_from_depot(destination) if distance is None else distance,
+            payment_type,
+            payment_status
+        )
+        return self.insert_package(package)
+
+    @journaled
+    def insert_package(self, package):
+        """Add an already validated Package (e.g. replayed from the journal)."""
+        package = self.packages.append(package)
+        # Recorded before the allocation so a drift rebalance is journaled after it
+        self.record("add", package=package_fields(package))
+        self.trucks = self.allocator.add(package)
+        return package
+
+    @timed("import_packages")
+    @journaled
+    def import_packages(self, packages):
+        """Add a validated batch without allocating it; follow up with a reallocation."""
+        self.packages.extend(packages)
+        self.record("import", packages=[package_fields(p) for p in packages])
+
+    @timed("cancel_package")
+    @journaled
+    def cancel_package(self, package_code):
+        package = self.packages.remove(package_code)
+        self.record("cancel", code=package_code)
+        self.codes.release(package.package_code)
+        # Repack only the truck the package leaves
+        self.trucks = self.allocator.cancel(package)
+        return package
+
+    @timed("confirm_payment")
+    @journaled
+    def confirm_payment(self, package_code):
+        package = self.find_package(package_code)
+        # COD payments are automatically valid
+        package.payment_status = "Pay later (COD)" if package.shipping_type == "COD" else "Paid"
+        self.allocator.update_status(package)
+        self.record("pay", code=package_code)
+        return package
+
+    # Index queries: O(1) or O(matches) instead of scanning every package
+    def packages_in_city(self, city):
+        return self.packages.with_location(city)
+
+    def packages_with_status(self, payment_status):
+        return self.packages.with_status(payment_status)
+
+    def truck_of(self, package_code):
+        """Index into self.trucks of the truck carrying this package."""
+        return self.allocator.truck_of[package_code]
+
+    def unpaid_packages(self, truck_index):
+        return [self.packages.get(code) for code in sorted(self.allocator.unpaid[truck_index])]
+
+    def truck_cities(self, truck_index):
+        """Unique cities of a truck, with the depot at index 0."""
+        depot = self.cities.depot
+        cities = [depot] + sorted(set(self.allocator.cities[truck_index]) - {depot})
+        missing_coords = [city for city in cities if city not in self.city_coordinates]
+        if missing_coords:
+            raise ValueError(f"Missing coordinates for: {', '.join(missing_coords)}")
+        return cities
+
+    @timed("route_truck")
+    def route_truck(self, truck_index):
+        """Optimized closed route from the depot and its length in km."""
+        cities = self.truck_cities(truck_index)
+        # Build the distance matrix once for this truck, then route over it
+        tour, length = solve_tsp(self.distances.rows(cities))
+        return [cities[i] for i in tour], length
+
+    @timed("plan_fleet")
+    def plan_fleet(self, max_workers=None):
+        """Route every truck in parallel; returns [(route, km)] and the fleet total."""
+        truck_cities = [self.truck_cities(i) for i in range(len(self.trucks))]
+        routes = route_fleet(truck_cities, self.city_coordinates, self.distances.metric, max_workers)
+        return routes, sum(length for _, length in routes)
+
+    def backup_route(self, truck_index):
+        """Nearest-neighbor route from the depot, as a quick fallback to route_truck."""
+        cities = self.truck_cities(truck_index)
+        # Cached matrix for small trucks, k-d tree queries for large ones
+        tour = nearest_neighbor_tour(self.distances.rows(cities))
+        return [cities[i] for i in tour] + [cities[0]]
+
+    @timed("invoice_fleet")
+    def invoice_fleet(self, tariff=None, trucks=None):
+        """Invoices for `trucks` (default: all), priced in one vectorized pass.
+
+        The whole fleet is priced over the full columns; a few trucks only
+        over their own rows. A truck with packages that are neither Paid nor
+        Pay later (COD) gets an Invoice listing them in `unpaid` and no
+        costs, instead of an error.
+        """
+        tariff = self.tariff if tariff is None else tariff
+        store = self.packages
+        locations = store.locations.values
+
+        invoices = []
+        billed = []  # (invoice, store rows) still to be priced
+        for i in (range(len(self.trucks)) if trucks is None else trucks):
+            unpaid = sorted(self.allocator.unpaid[i])
+            if unpaid:
+                invoices.append(Invoice(i, [], [], [], 0.0, unpaid))
+                continue
+            codes = [p.package_code for p in self.trucks[i]]
+            rows = array("L", (store.row_of[code] for code in codes))
+            invoice = Invoice(i, codes, [locations[store.location_ids[row]] for row in rows], [], 0.0)
+            invoices.append(invoice)
+            billed.append((invoice, rows))
+
+        if trucks is None:
+            # Row positions index the uncompacted columns directly
+            costs = tariff.costs(store.weights, store.distances, store.shipping_ids, store.shipping_types.values)
+            positions = [rows for _, rows in billed]
+        else:
+            rows = array("L", (row for _, truck_rows in billed for row in truck_rows))
+            costs = tariff.costs(array("l", (store.weights[row] for row in rows)),
+                                 array("l", (store.distances[row] for row in rows)),
+                                 array("B", (store.shipping_ids[row] for row in rows)),
+                                 store.shipping_types.values)
+            positions = []
+            for _, truck_rows in billed:
+                start = positions[-1].stop if positions else 0
+                positions.append(range(start, start + len(truck_rows)))
+        for (invoice, _), at in zip(billed, positions):
+            if np is not None and isinstance(costs, np.ndarray):
+                invoice.costs = costs[np.asarray(at, dtype=np.intp)].tolist()
+            else:
+                invoice.costs = [costs[k] for k in at]
+            invoice.total = sum(invoice.costs)
+        return invoices
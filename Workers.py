@@ -0,0 +1,93 @@
+"""Run allocation and routing off the Tk event thread.
+
+Jobs are plain module-level functions (allocate_bins, solve_tsp, ...) so
+they can go to a process pool and use every core. Results come back
+through a queue that the UI thread polls with `schedule` (root.after);
+Tk is never touched from a worker.
+"""
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from Metrics import METRICS
+
+POLL_MS = 50
+
+
+class JobRunner:
+    """One live job per key; submitting again under a key supersedes the old job.
+
+    A superseded job is cancelled if it has not started, and its result is
+    dropped if it has.
+    """
+
+    def __init__(self, schedule, processes=True, max_workers=None, on_change=None):
+        self.schedule = schedule
+        max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers) if processes else ThreadPoolExecutor(max_workers)
+        self.max_workers = max_workers
+        self.on_change = on_change  # called with the running job keys
+        self.results = queue.Queue()
+        self.jobs = {}  # key -> (generation, future)
+        self.generation = 0
+        self.polling = False
+
+    def submit(self, key, fn, *args, on_done, on_error=None):
+        self.cancel(key)
+        self.generation += 1
+        generation = self.generation
+        started = time.perf_counter()
+        future = self.executor.submit(fn, *args)
+        self.jobs[key] = (generation, future)
+        future.add_done_callback(lambda f: self.results.put(
+            (key, generation, f, on_done, on_error, time.perf_counter() - started)))
+        self._changed()
+        if not self.polling:
+            self.polling = True
+            self.schedule(POLL_MS, self._poll)
+
+    def cancel(self, key):
+        job = self.jobs.pop(key, None)
+        if job:
+            job[1].cancel()
+            self._changed()
+
+    def running(self):
+        return list(self.jobs)
+
+    def shutdown(self):
+        self.jobs.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    key, generation, future, on_done, on_error, seconds = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                job = self.jobs.get(key)
+                if job is None or job[0] != generation or future.cancelled():
+                    continue  # superseded
+                del self.jobs[key]
+                self._changed()
+                if METRICS.enabled:
+                    # Queue wait plus run time in the worker, which has its own (idle) METRICS
+                    METRICS.observe(f"job.{key}", seconds)
+                error = future.exception()
+                if error is None:
+                    on_done(future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    raise error
+        finally:
+            if self.jobs:
+                self.schedule(POLL_MS, self._poll)
+            else:
+                self.polling = False
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.running())
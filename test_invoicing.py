@@ -0,0 +1,34 @@
+import unittest
+
+from TruckCore import Package, TruckManager
+
+
+def manager_with(count):
+    packages = [Package(f"X{i:03d}", "Da Nang", 3, 764, "COD", "Pay later (COD)") for i in range(count)]
+    return TruckManager(max_weight=25, packages=packages)
+
+
+class InvoiceFleet(unittest.TestCase):
+    def test_invoice_survives_compaction(self):
+        manager = manager_with(200)
+        invoice = manager.invoice_fleet(trucks=[0])[0]
+        lines = list(invoice.lines())
+        for p in list(manager.packages)[:150]:
+            if p.package_code not in invoice.codes:
+                manager.cancel_package(p.package_code)
+        manager.packages.compact()
+        self.assertEqual(list(invoice.lines()), lines)
+
+    def test_one_truck_matches_the_fleet_pass(self):
+        manager = manager_with(60)
+        manager.cancel_package("X005")
+        fleet = manager.invoice_fleet()
+        for i in range(len(manager.trucks)):
+            (single,) = manager.invoice_fleet(trucks=[i])
+            self.assertEqual(list(single.lines()), list(fleet[i].lines()))
+            self.assertAlmostEqual(single.total, fleet[i].total)
+            self.assertAlmostEqual(single.total, sum(manager.tariff.cost(p) for p in manager.trucks[i]))
+
+
+if __name__ == "__main__":
+    unittest.main()
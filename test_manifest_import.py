@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from ManifestImport import import_manifest
+from TruckCore import TruckManager
+
+HEADER = "package_code,location,weight,shipping_type,payment_status\n"
+
+
+class ImportManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.manager = TruckManager(packages=[])
+
+    def manifest(self, data, name="manifest.csv"):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        return path
+
+    def test_payment_status_must_match_shipping_type(self):
+        path = self.manifest(HEADER + "A1,Dalat,3,COD,Paid\n"
+                                      "A2,Dalat,3,Credit Card,Paid\n"
+                                      "A3,Dalat,3,Credit Card,Refunded\n"
+                                      "A4,Dalat,3,COD,\n")
+        report = import_manifest(self.manager, path)
+        self.assertEqual(report.added, 2)
+        self.assertEqual([line for line, _ in report.errors], [2, 4])
+        self.assertEqual(self.manager.find_package("A2").payment_status, "Paid")
+        self.assertEqual(self.manager.find_package("A4").payment_status, "Pay later (COD)")
+
+    def test_many_distinct_statuses_are_rejected_not_stored(self):
+        rows = "".join(f"B{i:04d},Hai Phong,2,Bank Transfer,status {i}\n" for i in range(300))
+        report = import_manifest(self.manager, self.manifest(HEADER + rows))
+        self.assertEqual((report.added, report.error_count), (0, 300))
+        self.assertEqual(len(self.manager.packages), 0)
+
+    def test_duplicate_codes_are_rejected(self):
+        existing = self.manager.add_package(3, "Dalat", "COD").package_code
+        cancelled = self.manager.add_package(3, "Dalat", "COD").package_code
+        self.manager.cancel_package(cancelled)
+        path = self.manifest(HEADER + f"{existing},Dalat,3,COD,\nF1,Dalat,3,COD,\nF1,Dalat,3,COD,\n"
+                                      f"{cancelled},Dalat,3,COD,\n")
+        report = import_manifest(self.manager, path)
+        self.assertEqual(report.added, 2)
+        self.assertEqual([line for line, _ in report.errors], [2, 4])
+
+    def test_generated_codes_do_not_collide_with_manifest_codes(self):
+        upcoming = TruckManager(packages=[])
+        upcoming.codes = type(self.manager.codes)(self.manager.codes.key)
+        codes = [upcoming.generate_random_code() for _ in range(3)]
+        # The manifest holds the codes the allocator is about to generate
+        rows = "".join(f"{code},Dalat,3,COD,\n" for code in codes) + ",Dalat,3,COD,\n" * 3
+        report = import_manifest(self.manager, self.manifest(HEADER + rows))
+        self.assertEqual((report.added, report.error_count), (6, 0))
+        self.assertEqual(len({p.package_code for p in self.manager.packages}), 6)
+
+    def test_out_of_range_distance_is_rejected(self):
+        path = self.manifest("package_code,location,weight,shipping_type,distance\n"
+                             "E1,Dalat,3,COD,99999999999999999999\nE2,Dalat,3,COD,-5\nE3,Dalat,3,COD,1480\n")
+        report = import_manifest(self.manager, path)
+        self.assertEqual((report.added, report.errors), (1, [(2, "Invalid distance"), (3, "Invalid distance")]))
+
+    def test_field_types_are_checked(self):
+        rows = [
+            '{"location": ["Dalat"], "weight": 3, "shipping_type": "COD"}',
+            '{"location": "Dalat", "weight": 3.9, "shipping_type": "COD"}',
+            '{"location": "Dalat", "weight": true, "shipping_type": "COD"}',
+            '{"location": "Dalat", "weight": 3, "shipping_type": {"COD": 1}}',
+            '{"location": "Dalat", "weight": 3, "shipping_type": "COD", "package_code": 123}',
+            '{"location": "Dalat", "weight": 3, "shipping_type": "COD", "package_code": "A\\nB"}',
+            '{"location": "Dalat", "weight": 3, "shipping_type": "COD", "distance": [1]}',
+            '{"location": "Dalat", "weight": "3", "shipping_type": "COD", "package_code": "G1"}',
+            '{"location": "Dalat", "weight": 3, "shipping_type": "COD", "distance": 1480}',
+        ]
+        report = import_manifest(self.manager, self.manifest("\n".join(rows) + "\n", "manifest.jsonl"))
+        self.assertEqual(report.added, 2)
+        self.assertEqual(report.errors, [
+            (1, "Invalid location"), (2, "Invalid weight"), (3, "Invalid weight"), (4, "Invalid shipping type"),
+            (5, "Invalid package code"), (6, "Invalid package code"), (7, "Invalid distance"),
+        ])
+
+    def test_reader_errors_are_reported(self):
+        path = self.manifest(HEADER + "C1,Dalat,3,COD,\nC2,Dal\0at,3,COD,\nC3,Dalat,3,COD,\n")
+        report = import_manifest(self.manager, path)
+        self.assertEqual(report.added, 2)
+        self.assertEqual([line for line, _ in report.errors], [3])
+
+    def test_undecodable_bytes_reject_only_their_row(self):
+        rows = b"".join(b"D%04d,Dalat,3,COD,\n" % i for i in range(3000))
+        path = self.manifest(HEADER.encode() + b"D,\xff\xfe,3,COD,\n" + rows)
+        report = import_manifest(self.manager, path)
+        self.assertEqual((report.added, report.errors), (3000, [(2, "Invalid destination")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
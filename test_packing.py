@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from TruckCore import pack_best_fit_decreasing, pack_first_fit_decreasing
+
+
+def naive_best_fit_decreasing(weights, capacity):
+    # O(n * bins) reference: scan every bin for the least spare room that fits
+    bins, loads = [], []
+    for i in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        fits = [b for b, load in enumerate(loads) if load + weights[i] <= capacity]
+        if fits:
+            b = min(fits, key=lambda b: (capacity - loads[b], b))
+            bins[b].append(i)
+            loads[b] += weights[i]
+        else:
+            bins.append([i])
+            loads.append(weights[i])
+    return bins
+
+
+class BestFitDecreasing(unittest.TestCase):
+    def check(self, weights, capacity):
+        bins = pack_best_fit_decreasing(weights, capacity)
+        self.assertEqual(sorted(i for b in bins for i in b), list(range(len(weights))))
+        self.assertTrue(all(sum(weights[i] for i in b) <= capacity for b in bins))
+        self.assertEqual(len(bins), len(naive_best_fit_decreasing(weights, capacity)))
+
+    def test_single_weight(self):
+        self.check([3] * 20, 25)
+        self.check([2, 2], 25)
+        self.check([25] * 4, 25)
+        self.assertEqual(len(pack_best_fit_decreasing([3] * 20, 25)),
+                         len(pack_first_fit_decreasing([3] * 20, 25)))
+
+    def test_two_weights(self):
+        self.check([5, 3] * 10, 11)
+
+    def test_random(self):
+        rng = random.Random(3)
+        for capacity, heaviest in ((25, 10), (100, 60), (1000, 400)):
+            for _ in range(20):
+                weights = [rng.randint(1, heaviest) for _ in range(rng.randint(1, 300))]
+                self.check(weights, capacity)
+
+    def test_empty(self):
+        self.assertEqual(pack_best_fit_decreasing([], 25), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import random
+import tempfile
+import unittest
+
+from ManifestImport import import_manifest
+from Persistence import StateStore
+from TruckCore import CODE_CLAIM_WINDOW, CodeAllocator, Package, package_fields
+
+
+def state(manager):
+    packages = sorted((package_fields(p) for p in manager.packages), key=lambda f: str(f["package_code"]))
+    trucks = [[p.package_code for p in truck] for truck in manager.trucks]
+    return packages, trucks
+
+
+class ReloadRoundTrip(unittest.TestCase):
+    """Every journaled operation survives a restart, with and without a checkpoint after it."""
+
+    def setUp(self):
+        random.seed(7)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def assert_round_trip(self, operation, checkpoint_every):
+        store = StateStore(self.directory.name, checkpoint_every=checkpoint_every)
+        manager = store.load()
+        operation(manager)
+        expected = state(manager)
+        store.close()
+
+        reloaded = StateStore(self.directory.name, checkpoint_every=checkpoint_every)
+        self.assertEqual(state(reloaded.load()), expected)
+        reloaded.close()
+
+    def check(self, operation):
+        for checkpoint_every in (1, 3, 10_000):
+            with self.subTest(checkpoint_every=checkpoint_every):
+                self.directory.cleanup()
+                self.directory = tempfile.TemporaryDirectory()
+                self.assert_round_trip(operation, checkpoint_every)
+
+    def test_add(self):
+        self.check(lambda manager: manager.add_package(3, "Dalat", "Credit Card"))
+
+    def test_many_adds(self):
+        def add_many(manager):
+            for i in range(40):
+                manager.add_package(1 + i % 10, "Nha Trang" if i % 3 else "Da Nang", "COD")
+        self.check(add_many)
+
+    def test_cancel(self):
+        self.check(lambda manager: manager.cancel_package(manager.trucks[0][0].package_code))
+
+    def test_cancel_every_package(self):
+        def cancel_all(manager):
+            for code in [p.package_code for p in manager.packages]:
+                manager.cancel_package(code)
+        self.check(cancel_all)
+
+    def test_pay(self):
+        def pay(manager):
+            package = manager.add_package(4, "Hai Phong", "Bank Transfer")
+            manager.confirm_payment(package.package_code)
+        self.check(pay)
+
+    def test_rebalance(self):
+        def rebalance(manager):
+            manager.allocation_strategy = "bfd"
+            manager.rebalance_trucks()
+        self.check(rebalance)
+
+    def test_import(self):
+        def import_batch(manager):
+            manager.import_packages([
+                Package(f"IMP{i:03d}", "Da Nang", 2 + i % 5, 764, "COD", "Pay later (COD)") for i in range(12)
+            ])
+            manager.rebalance_trucks()
+        self.check(import_batch)
+
+    def test_unallocated_import_then_add(self):
+        # The rebalance load() runs for unallocated imports is journaled, so a
+        # later add replays onto the same allocation
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        manager.import_packages([Package(f"IMP{i:03d}", "Dalat", 5, 1480, "COD", "Pay later (COD)") for i in range(9)])
+        store.close()
+
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        manager.add_package(3, "Dalat", "COD")
+        expected = state(manager)
+        store.close()
+
+        reloaded = StateStore(self.directory.name)
+        self.assertEqual(state(reloaded.load()), expected)
+        reloaded.close()
+
+    def test_torn_final_write(self):
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        for _ in range(3):
+            manager.add_package(3, "Dalat", "COD")
+        store.close()
+        with open(store.journal_path, "a") as f:
+            f.write('{"seq": 99, "op": "add", "pack')  # the process died mid-write
+
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        manager.add_package(4, "Hai Phong", "COD")
+        manager.add_package(5, "Nha Trang", "COD")
+        expected = state(manager)
+        store.close()
+
+        reloaded = StateStore(self.directory.name)
+        self.assertEqual(state(reloaded.load()), expected)
+        reloaded.close()
+
+    def test_codes_with_separators_and_non_string_codes(self):
+        def add_odd_codes(manager):
+            manager.import_packages([
+                Package("LINE\nBREAK", "Dalat", 3, 1480, "COD", "Pay later (COD)"),
+                Package(123, "Dalat", 4, 1480, "COD", "Pay later (COD)"),
+            ])
+            manager.rebalance_trucks()
+        self.check(add_odd_codes)
+
+    def test_imported_codes_are_not_reissued(self):
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        manifest = f"{self.directory.name}/manifest.csv"
+        with open(manifest, "w") as f:
+            f.write("location,weight,shipping_type\n" + "Dalat,3,COD\n" * 5)
+        import_manifest(manager, manifest)
+        imported = [p.package_code for p in manager.packages][-5:]
+        store.close()
+
+        store = StateStore(self.directory.name)
+        manager = store.load()
+        for code in imported:
+            manager.cancel_package(code)
+        added = [manager.add_package(3, "Dalat", "COD").package_code for _ in range(5)]
+        store.close()
+        self.assertFalse(set(added) & set(imported))
+
+
+class CodeClaims(unittest.TestCase):
+    def test_foreign_codes_do_not_advance_the_counter(self):
+        codes = CodeAllocator(key=1)
+        issued = [codes.next() for _ in range(10)]
+        foreign = CodeAllocator(key=2)
+        claimed = [foreign.next() for _ in range(200)]
+        for code in claimed:
+            if codes.index(code) >= CODE_CLAIM_WINDOW:
+                self.assertFalse(codes.claim(code))
+        self.assertLess(codes.counter, CODE_CLAIM_WINDOW + 10)
+        self.assertLess(len(codes.issued), CODE_CLAIM_WINDOW)
+        self.assertTrue(all(code in codes for code in issued))
+
+    def test_replayed_codes_are_claimed(self):
+        codes = CodeAllocator(key=1)
+        issued = [codes.next() for _ in range(5)]
+        replayed = CodeAllocator(key=1)
+        for code in issued:
+            self.assertTrue(replayed.claim(code))
+        self.assertEqual(replayed.next(), codes.next())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import math
+import random
+import unittest
+
+from TruckCore import neighbor_lists, nearest_neighbor_tour, or_opt, solve_tsp, tour_length
+
+
+def random_matrix(n, seed):
+    rng = random.Random(seed)
+    points = [(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(n)]
+    return [[math.dist(a, b) for b in points] for a in points]
+
+
+def closed_length(tour, matrix):
+    return tour_length(tour + tour[:1], matrix)
+
+
+class OrOpt(unittest.TestCase):
+    def test_saved_length_matches_recomputed_tour(self):
+        for seed in range(20):
+            matrix = random_matrix(60, seed)
+            tour = nearest_neighbor_tour(matrix)
+            before = closed_length(tour, matrix)
+            saved = or_opt(tour, matrix, neighbor_lists(matrix))
+            after = closed_length(tour, matrix)
+            self.assertEqual(sorted(tour), list(range(60)))
+            self.assertAlmostEqual(before - after, saved, places=6)
+
+    def test_moves_single_stop_to_its_neighbors(self):
+        # Stop 5 sits next to 1 and 2 but is visited between 4 and 6; moving it
+        # back saves far more than the (short) edge 1-2 it breaks
+        points = [(0, 0), (100, 0), (102, 0), (200, 0), (200, 100), (101, 1), (0, 100)]
+        matrix = [[math.dist(a, b) for b in points] for a in points]
+        tour = [0, 1, 2, 3, 4, 5, 6]
+        before = closed_length(tour, matrix)
+        saved = or_opt(tour, matrix, neighbor_lists(matrix))
+        self.assertGreater(saved, 60)
+        self.assertAlmostEqual(before - closed_length(tour, matrix), saved, places=6)
+
+    def test_solver_is_not_worse_than_nearest_neighbor(self):
+        for seed in range(5):
+            matrix = random_matrix(80, seed)
+            start = nearest_neighbor_tour(matrix)
+            _, length = solve_tsp(matrix, exact_limit=0)
+            self.assertLessEqual(length, closed_length(start, matrix) + 1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()